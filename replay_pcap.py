@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+replay_pcap.py
+--------------
+Replays the DNS queries of a host's capture (PCAP_1_H1.pcap, ...) against the
+custom resolver, keeping the original inter-arrival times so bursts and
+repeated names hit the resolver the way they did in the capture.
+
+The capture is read directly (pcap or pcapng, streamed packet by packet);
+queries are UDP packets to port 53 with the QR bit clear, like the
+`tshark -Y "dns && udp.port == 53"` extraction used for pcap/h*_domains.txt.
+Replies are matched by transaction ID while later queries are still being
+sent, and per-query results go to results_replay/<Host>_replay_results.csv.
+
+Usage (from the matching Mininet host):
+    h1 python3 replay_pcap.py pcap/PCAP_1_H1.pcap                 # original timing
+    h1 python3 replay_pcap.py pcap/PCAP_1_H1.pcap --speed 10      # 10x faster
+    h1 python3 replay_pcap.py pcap/PCAP_1_H1.pcap --speed 0       # as fast as possible
+    python3 replay_pcap.py pcap/PCAP_1_H1.pcap --write-domains --no-replay
+"""
+
+import socket, struct, time, csv, os, re, sys, threading, argparse
+
+from resolver.wire import build_query, parse_question, response_status
+
+DNS_SERVER_IP = "10.0.0.5"
+DNS_SERVER_PORT = 53
+RESULTS_DIR = "results_replay"
+TIMEOUT = 5.0           # seconds to wait for each reply
+MAX_OUTSTANDING = 256   # in-flight queries when replaying as fast as possible
+
+# Mininet host addresses from dns_topo.py
+HOST_IPS = {"H1": "10.0.0.1", "H2": "10.0.0.2", "H3": "10.0.0.3", "H4": "10.0.0.4"}
+
+# ---------------- Capture readers ----------------
+PCAP_MAGIC = {b"\xd4\xc3\xb2\xa1": ("<", 1e-6), b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+              b"\x4d\x3c\xb2\xa1": ("<", 1e-9), b"\xa1\xb2\x3c\x4d": (">", 1e-9)}
+PCAPNG_SHB = b"\x0a\x0d\x0d\x0a"
+
+def read_packets(path):
+    """Yield (timestamp, linktype, frame) for every packet in a pcap/pcapng file."""
+    with open(path, "rb") as f:
+        magic = f.read(4)
+        if magic in PCAP_MAGIC:
+            yield from read_pcap(f, *PCAP_MAGIC[magic])
+        elif magic == PCAPNG_SHB:
+            yield from read_pcapng(f)
+        else:
+            raise ValueError(f"{path}: not a pcap/pcapng file")
+
+def read_pcap(f, endian, resolution):
+    linktype = struct.unpack(endian + "I", f.read(20)[16:20])[0] & 0xFFFF
+    while True:
+        header = f.read(16)
+        if len(header) < 16:
+            return
+        sec, frac, caplen, _ = struct.unpack(endian + "IIII", header)
+        yield sec + frac * resolution, linktype, f.read(caplen)
+
+def read_pcapng(f):
+    endian, interfaces = "<", []  # interface id → (linktype, seconds per tick)
+    block_type = struct.unpack("<I", PCAPNG_SHB)[0]
+    while True:
+        raw_len = f.read(4)
+        if len(raw_len) < 4:
+            return
+        if block_type == 0x0A0D0D0A:
+            order = f.read(4)
+            endian = "<" if order == b"\x4d\x3c\x2b\x1a" else ">"
+            body = order + f.read(struct.unpack(endian + "I", raw_len)[0] - 16)
+            interfaces = []  # a new section restarts interface numbering
+        else:
+            body = f.read(struct.unpack(endian + "I", raw_len)[0] - 12)
+        f.read(4)  # trailing block length
+
+        if block_type == 1:  # Interface Description
+            linktype = struct.unpack_from(endian + "H", body, 0)[0]
+            interfaces.append((linktype, if_tsresol(body[8:], endian)))
+        elif block_type in (6, 2):  # Enhanced / obsolete Packet
+            if block_type == 6:
+                iface, hi, lo, caplen = struct.unpack_from(endian + "IIII", body, 0)
+            else:
+                iface, _, hi, lo, caplen = struct.unpack_from(endian + "HHIII", body, 0)
+            linktype, tick = interfaces[iface]
+            yield ((hi << 32) | lo) * tick, linktype, body[20:20 + caplen]
+
+        block = f.read(4)
+        if len(block) < 4:
+            return
+        block_type = struct.unpack(endian + "I", block)[0]
+
+def if_tsresol(options, endian):
+    offset = 0
+    while offset + 4 <= len(options):
+        code, length = struct.unpack_from(endian + "HH", options, offset)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            v = options[offset + 4]
+            return 2.0 ** -(v & 0x7F) if v & 0x80 else 10.0 ** -v
+        offset += 4 + (length + 3) // 4 * 4
+    return 1e-6
+
+# ---------------- Packet decoding ----------------
+def ip_payload(linktype, frame):
+    """IP packet inside a link-layer frame, or None for link types we skip."""
+    if linktype == 1:  # Ethernet, possibly VLAN tagged
+        offset, ethertype = 14, struct.unpack_from("!H", frame, 12)[0]
+        while ethertype in (0x8100, 0x88A8):
+            ethertype = struct.unpack_from("!H", frame, offset + 2)[0]
+            offset += 4
+        return frame[offset:] if ethertype in (0x0800, 0x86DD) else None
+    if linktype == 113:  # Linux cooked capture
+        return frame[16:] if struct.unpack_from("!H", frame, 14)[0] in (0x0800, 0x86DD) else None
+    if linktype == 276:  # Linux cooked capture v2
+        return frame[20:] if struct.unpack_from("!H", frame, 0)[0] in (0x0800, 0x86DD) else None
+    if linktype == 0:  # BSD loopback
+        return frame[4:]
+    if linktype in (12, 101, 228, 229):  # raw IP
+        return frame
+    return None
+
+def dns_query(linktype, frame):
+    """(source IP, DNS message) if the frame is a UDP DNS query, else None."""
+    try:
+        packet = ip_payload(linktype, frame)
+        if not packet:
+            return None
+        version = packet[0] >> 4
+        if version == 4:
+            ihl, proto = (packet[0] & 0x0F) * 4, packet[9]
+            if proto != 17 or struct.unpack_from("!H", packet, 6)[0] & 0x1FFF:  # not UDP, or a later fragment
+                return None
+            src, udp = socket.inet_ntop(socket.AF_INET, packet[12:16]), packet[ihl:]
+        elif version == 6:
+            if packet[6] != 17:
+                return None
+            src, udp = socket.inet_ntop(socket.AF_INET6, packet[8:24]), packet[40:]
+        else:
+            return None
+        if struct.unpack_from("!H", udp, 2)[0] != 53:
+            return None
+        dns = udp[8:]
+        if len(dns) < 12 or dns[2] & 0x80:  # response
+            return None
+        return src, dns
+    except (IndexError, struct.error):
+        return None
+
+def extract_queries(path):
+    """Yield (timestamp, source IP, qname, qtype) for each DNS query in a capture."""
+    for ts, linktype, frame in read_packets(path):
+        found = dns_query(linktype, frame)
+        if not found:
+            continue
+        try:
+            qname, qtype, _, _ = parse_question(found[1], 12)
+        except (IndexError, struct.error, UnicodeDecodeError):
+            continue
+        yield ts, found[0], qname, qtype
+
+# ---------------- Replay ----------------
+def replay(queries, speed, source_ip, on_result, server=(DNS_SERVER_IP, DNS_SERVER_PORT)):
+    """Send queries (extract_queries tuples, consumed as they come) on their
+    original schedule divided by `speed` (0 = no waiting), collecting replies
+    concurrently. on_result(offset, qname, qtype, status, latency_ms) is called
+    once per query, under the pending lock. Returns (queries sent, elapsed s)."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((source_ip or "", 0))
+    sock.settimeout(0.2)
+    pending, lock, done = {}, threading.Lock(), threading.Event()
+
+    def receiver():
+        while not done.is_set():
+            try:
+                data, _ = sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            now = time.time()
+            with lock:
+                entry = pending.pop(data[:2], None)
+                if entry:
+                    offset, qname, qtype, sent = entry
+                    rcode, _ = response_status(data)
+                    on_result(offset, qname, qtype, {0: "SUCCESS", 3: "NXDOMAIN"}.get(rcode, "FAIL"),
+                              (now - sent) * 1000)
+
+    threading.Thread(target=receiver, daemon=True).start()
+    start, first, count = time.time(), None, 0
+    for count, (ts, _, qname, qtype) in enumerate(queries, 1):
+        first = ts if first is None else first
+        if speed:
+            delay = start + (ts - first) / speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        else:
+            while len(pending) >= MAX_OUTSTANDING:
+                time.sleep(0.001)
+                expire(pending, lock, on_result)
+        query = build_query(qname, qtype)
+        with lock:
+            while query[:2] in pending:
+                query = build_query(qname, qtype)
+            pending[query[:2]] = (ts - first, qname, qtype, time.time())
+        sock.sendto(query, server)
+        expire(pending, lock, on_result)
+
+    while pending:
+        time.sleep(0.05)
+        expire(pending, lock, on_result)
+    done.set()
+    sock.close()
+    return count, time.time() - start
+
+def expire(pending, lock, on_result):
+    now = time.time()
+    with lock:
+        for tid in [tid for tid, entry in pending.items() if now - entry[3] > TIMEOUT]:
+            offset, qname, qtype, _ = pending.pop(tid)
+            on_result(offset, qname, qtype, "TIMEOUT", TIMEOUT * 1000)
+
+def saving_domains(queries, f):
+    """Pass queries through, writing each name to `f` on the way."""
+    for q in queries:
+        f.write(q[2] + "\n")
+        yield q
+
+# ---------------- Entry ----------------
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Replay DNS queries from a capture with original timing")
+    ap.add_argument("capture")
+    ap.add_argument("--host", help="H1..H4 (default: taken from the file name)")
+    ap.add_argument("--speed", type=float, default=1.0, help="time scale; 0 = as fast as possible")
+    ap.add_argument("--source", help="source address (default: the host's Mininet IP)")
+    ap.add_argument("--server", default=DNS_SERVER_IP)
+    ap.add_argument("--port", type=int, default=DNS_SERVER_PORT)
+    ap.add_argument("--write-domains", nargs="?", const="", metavar="PATH",
+                    help="also write the queried names (default pcap/<host>_domains.txt)")
+    ap.add_argument("--no-replay", action="store_true")
+    args = ap.parse_args()
+
+    m = re.search(r"_(H\d+)\b", os.path.basename(args.capture), re.I)
+    host_name = (args.host or (m.group(1) if m else "")).upper()
+    if not host_name:
+        print("[!] Cannot tell the host from the file name; pass --host H1")
+        sys.exit(1)
+
+    # One streaming pass over the capture feeds the domain list and the replay
+    queries, domains_file = extract_queries(args.capture), None
+    if args.write_domains is not None:
+        domains_path = args.write_domains or f"pcap/{host_name.lower()}_domains.txt"
+        domains_file = open(domains_path, "w")
+        queries = saving_domains(queries, domains_file)
+
+    if args.no_replay:
+        print(f"[+] {sum(1 for _ in queries)} DNS queries in {args.capture}")
+    else:
+        source_ip = args.source or HOST_IPS.get(host_name)
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        csv_file = f"{RESULTS_DIR}/{host_name}_replay_results.csv"
+        stats = {"success": 0, "latency": 0.0}
+        with open(csv_file, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Offset (s)", "Domain", "QType", "Status", "Latency (ms)"])
+
+            def record(offset, qname, qtype, status, latency):
+                writer.writerow([f"{offset:.6f}", qname, qtype, status, round(latency, 2)])
+                stats["success"] += status == "SUCCESS"
+                stats["latency"] += latency
+
+            try:
+                sent, elapsed = replay(queries, args.speed, source_ip, record, (args.server, args.port))
+            except OSError as e:
+                print(f"[!] Cannot send from {source_ip} ({e}); run this from {host_name.lower()} in Mininet or pass --source")
+                sys.exit(1)
+
+        print(f"\n--- {host_name} (speed {args.speed or 'max'}) ---")
+        print(f"Queries: {sent}")
+        if sent:
+            print(f"Success: {stats['success']}")
+            print(f"Failed: {sent - stats['success']}")
+            print(f"Average latency: {stats['latency'] / sent:.2f} ms")
+            print(f"Throughput: {sent / elapsed:.2f} qps")
+        print(f"[✓] Results saved to {csv_file}")
+
+    if domains_file:
+        domains_file.close()
+        print(f"[✓] Domain list saved to {domains_path}")
@@ -14,71 +14,19 @@ import time
 import csv
 import os
 import sys
-import struct
-import random
+
+from resolver.wire import build_query, parse_response, T_A
 
 DNS_SERVER_IP = "10.0.0.5"
 DNS_SERVER_PORT = 53
 RESULTS_DIR = "results_custom"
 TIMEOUT = 5.0  # seconds
 
-# ---------------- DNS packet helpers ----------------
-
-def encode_domain(domain):
-    parts = domain.strip(".").split(".")
-    return b"".join(bytes([len(p)]) + p.encode() for p in parts) + b"\x00"
-
-def decode_domain(data, offset):
-    labels = []
-    while True:
-        length = data[offset]
-        if length == 0:
-            offset += 1
-            break
-        if (length & 0xC0) == 0xC0:
-            ptr = struct.unpack_from("!H", data, offset)[0] & 0x3FFF
-            sub, _ = decode_domain(data, ptr)
-            labels.append(sub)
-            offset += 2
-            break
-        labels.append(data[offset + 1 : offset + 1 + length].decode())
-        offset += 1 + length
-    return ".".join(labels), offset
-
-def build_query(domain, qtype=1, qclass=1):
-    tid = random.randint(0, 0xFFFF)
-    header = struct.pack("!HHHHHH", tid, 0x0100, 1, 0, 0, 0)
-    question = encode_domain(domain) + struct.pack("!HH", qtype, qclass)
-    return header + question, tid
-
-def parse_response(data):
-    """Return list of A record IPs"""
-    if not data or len(data) < 12:
-        return []
-    _, _, qdcount, ancount, _, _ = struct.unpack_from("!HHHHHH", data, 0)
-    offset = 12
-    # Skip question
-    for _ in range(qdcount):
-        _, offset = decode_domain(data, offset)
-        offset += 4  # type + class
-    # Parse answers
-    ips = []
-    for _ in range(ancount):
-        _, offset = decode_domain(data, offset)
-        rtype, rclass, ttl, rdlen = struct.unpack_from("!HHIH", data, offset)
-        offset += 10
-        rdata = data[offset : offset + rdlen]
-        offset += rdlen
-        if rtype == 1 and len(rdata) == 4:  # A record
-            ip = ".".join(map(str, rdata))
-            ips.append(ip)
-    return ips
-
 # ---------------- DNS query to custom resolver ----------------
 
 def query_custom_resolver(domain):
     """Send DNS query to custom resolver and measure latency"""
-    query, tid = build_query(domain)
+    query = build_query(domain)
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.settimeout(TIMEOUT)
     start = time.time()
@@ -86,7 +34,7 @@ def query_custom_resolver(domain):
         sock.sendto(query, (DNS_SERVER_IP, DNS_SERVER_PORT))
         data, _ = sock.recvfrom(512)
         latency = (time.time() - start) * 1000
-        ips = parse_response(data)
+        ips = [r[2] for r in parse_response(data)[0] if r[1] == T_A]
         return ips, latency
     except socket.timeout:
         return [], TIMEOUT * 1000
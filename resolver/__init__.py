@@ -0,0 +1,19 @@
+"""
+Shared core of the custom DNS resolvers.
+
+    wire.py       DNS message encoding/decoding
+    cache.py      multi-level TTL cache
+    iterative.py  budgeted iterative resolution (ResolutionTask)
+    forward.py    pooled UDP/TCP/TLS/DoH upstreams for forwarding mode
+    dnssec.py     optional DNSSEC validation of iterative answers
+    engine.py     cache → resolve → reply → log pipeline
+    server.py     UDP/TCP front end with admission control
+    config.py     defaults, JSON config file and CLI flags
+
+Run with `python3 -m resolver [--config FILE] [flags]`; custom_dns.py and
+custom_dns_cache.py are the no-cache and cache configurations.
+Only the standard library is used, and nothing heavy is imported at startup.
+"""
+
+from .config import Config, load_config
+from .engine import Engine
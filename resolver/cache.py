@@ -0,0 +1,61 @@
+"""
+Multi-level resolver cache with a fixed TTL.
+
+Levels:
+    RR     (domain, qtype) → answer records
+    CNAME  alias → canonical name (one entry per chain link)
+    NS     zone → list of NS names
+    GLUE   ns_name → IP
+    KEYS   zone → (DNSSEC status, validated DNSKEYs)
+
+Keys are compact wire-format bytes of the canonical name (plus the qtype for
+RR), so names differing only in case or a trailing dot share one entry.
+"""
+
+import time
+
+from .wire import T_CNAME, MAX_CHAIN, name_key, rr_key
+
+def cache_key(key):
+    return rr_key(*key) if isinstance(key, tuple) else name_key(key)
+
+class Cache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.levels = {"RR": {}, "CNAME": {}, "NS": {}, "GLUE": {}, "KEYS": {}}
+
+    def get(self, level, key):
+        entries, key = self.levels[level], cache_key(key)
+        if key not in entries: return None
+        val, ts = entries[key]
+        if time.time() - ts > self.ttl:
+            entries.pop(key, None)
+            return None
+        return val
+
+    def put(self, level, key, value):
+        self.levels[level][cache_key(key)] = (value, time.time())
+
+    def chain(self, domain, qtype):
+        """Follow cached CNAME links from `domain`. Returns (links, name, records);
+        `records` is None unless the RRset at the end of the chain is cached too."""
+        links, name = [], domain
+        for _ in range(MAX_CHAIN):
+            records = self.get("RR", (name, qtype))
+            if records is not None or qtype == T_CNAME:
+                return links, name, records
+            target = self.get("CNAME", name)
+            if target is None:
+                break
+            links.append((name, T_CNAME, target))
+            name = target
+        return links, name, None
+
+class NullCache(Cache):
+    """Stores nothing — the no-cache configuration of the engine."""
+
+    def __init__(self, ttl=0):
+        super().__init__(ttl)
+
+    def put(self, level, key, value):
+        pass
@@ -0,0 +1,94 @@
+"""
+Resolver configuration: defaults, overridden by a JSON file, overridden by
+command-line flags (one flag per field, e.g. --cache-ttl 60, --no-cache,
+--upstreams udp://8.8.8.8:53 tls://1.1.1.1:853#cloudflare-dns.com).
+
+    {"mode": "forward", "upstreams": ["udp://127.0.0.1:5300"], "cache_ttl": 60}
+"""
+
+import json, argparse
+from dataclasses import dataclass, field, fields, asdict
+
+ROOT_SERVERS = [
+    "198.41.0.4", "170.247.170.2", "192.33.4.12", "199.7.91.13",
+    "192.203.230.10", "192.5.5.241", "192.112.36.4", "198.97.190.53",
+    "192.36.148.17", "192.58.128.30", "193.0.14.129", "199.7.83.42",
+    "202.12.27.33"
+]
+
+# DS of the root zone's key-signing key (KSK-2017)
+ROOT_ANCHOR = ". 20326 8 2 E06D44B80B8F1D39A95C0B0D7C65D08458E880409BBC683457104237C7F8EC8D"
+
+@dataclass
+class Config:
+    # Listening socket and logs
+    server_ip: str = "10.0.0.5"
+    server_port: int = 53
+    summary_file: str = "resolver_summary.csv"
+    step_file: str = "resolver_detailed_steps.csv"
+    metrics_file: str = "resolver_metrics.csv"
+
+    # Pipeline: stages run in order for every query (see engine.STAGES)
+    cache: bool = True
+    cache_ttl: int = 300  # seconds
+    pipeline: list = field(default_factory=lambda: ["cache", "resolve", "reply", "log"])
+
+    # Where cache misses go: "iterative" walks down from root_servers,
+    # "forward" hands them to upstreams (see forward.py for the URL forms)
+    mode: str = "iterative"
+    root_servers: list = field(default_factory=lambda: list(ROOT_SERVERS))
+    dns_port: int = 53  # port of the servers contacted in iterative mode
+    upstreams: list = field(default_factory=lambda: ["udp://8.8.8.8:53", "tls://1.1.1.1:853#cloudflare-dns.com"])
+    tls_cafile: str = ""  # extra CA bundle for TLS/DoH upstreams, e.g. a local stub's certificate
+    case_randomization: bool = True  # 0x20: random qname case, answers must echo it (retried once without)
+
+    # Resolution budget
+    query_timeout: float = 3   # seconds per upstream query
+    max_queries: int = 40      # upstream queries per client query, NS lookups included
+    max_time: float = 10.0     # seconds per client query
+    max_depth: int = 3         # nesting of glueless NS lookups
+    ns_fanout: int = 3         # glueless NS names looked up in parallel
+
+    # DNSSEC validation (iterative mode only): bogus answers become SERVFAIL
+    dnssec: bool = False
+    trust_anchors: list = field(default_factory=lambda: [ROOT_ANCHOR])  # "zone keytag alg digest_type hexdigest"
+    validator_workers: int = 2  # processes verifying signatures; 0 verifies in the worker thread
+
+    # Admission control
+    client_rate: float = 50    # queries/s per client address
+    client_burst: float = 100
+    qname_rate: float = 5      # cache-miss queries/s per (qname, qtype)
+    qname_burst: float = 10
+    max_buckets: int = 10000   # tracked clients / names before idle ones are pruned
+    queue_size: int = 64       # requests waiting for a worker
+    queue_max_wait: float = 5.0  # seconds; older requests are shed, the client gave up
+    workers: int = 8
+    shed_action: str = "servfail"  # or "drop"
+
+def load_config(argv=None, **defaults):
+    """Config from `defaults` < --config JSON file < command-line flags."""
+    ap = argparse.ArgumentParser(description="Iterative / forwarding DNS resolver")
+    ap.add_argument("--config", help="JSON file with any of the options below")
+    for f in fields(Config):
+        flag = "--" + f.name.replace("_", "-")
+        if f.type is bool:
+            ap.add_argument(flag, action=argparse.BooleanOptionalAction, default=None)
+        elif f.type is list:
+            ap.add_argument(flag, nargs="+", default=None)
+        else:
+            ap.add_argument(flag, type=f.type, default=None)
+    args = ap.parse_args(argv)
+
+    values = asdict(Config())
+    values.update(defaults)
+    if args.config:
+        with open(args.config) as fh:
+            from_file = json.load(fh)
+        unknown = set(from_file) - set(values)
+        if unknown:
+            ap.error(f"unknown option(s) in {args.config}: {', '.join(sorted(unknown))}")
+        values.update(from_file)
+    values.update({k: v for k, v in vars(args).items() if k != "config" and v is not None})
+    if values["dnssec"] and values["mode"] == "forward":
+        ap.error("dnssec validates iterative resolution only; it cannot be combined with mode forward")
+    return Config(**values)
@@ -0,0 +1,468 @@
+"""
+DNSSEC validation (RFC 4033-4035) of iterative answers, in pure Python.
+
+Answers are checked against a chain of trust from the configured trust
+anchors (DS records) down to the signing zone: each zone's DNSKEY RRset must
+be signed by a key matching a validated DS from its parent. Supported
+algorithms are RSA/SHA-256 (8) and ECDSA P-256/SHA-256 (13).
+
+Each zone's validated keys are kept in the engine cache (KEYS level), so the
+chain is fetched once per TTL. Signature results are memoized, and new
+signatures are verified in a process pool so the big-integer maths stays
+off the worker threads. Cached answers are never re-validated.
+
+Negative answers (NXDOMAIN/NODATA) from a signed zone need its signed SOA
+and an NSEC (RFC 4035) or NSEC3 (RFC 5155) proof. A delegation without DS
+is only taken as unsigned (insecure) when the parent proves the DS absent
+or is unsigned itself.
+
+Not covered: the proof that a wildcard-expanded positive answer had no
+closer match.
+"""
+
+import os, time, struct, base64, hashlib, threading, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from .wire import (T_NS, T_CNAME, T_SOA, T_DNAME, T_DS, T_RRSIG, T_NSEC, T_DNSKEY, T_NSEC3,
+                   canonical, encode_domain, encode_rdata, decode_domain)
+
+ALG_RSASHA256, ALG_ECDSAP256 = 8, 13
+SECURE, INSECURE, BOGUS = "SECURE", "INSECURE", "BOGUS"
+MEMO_SIZE = 100000  # memoized signature results before the memo is reset
+NSEC3_MAX_ITERATIONS = 150  # RFC 9276: proofs needing more hashing are not accepted
+
+# ---------------- Record formats ----------------
+def parse_rrsig(rdata):
+    """(type covered, algorithm, labels, original TTL, expiration, inception, key tag, signer, signature)"""
+    fixed = struct.unpack_from("!HBBIIIH", rdata, 0)
+    signer, end = decode_domain(rdata, 18)
+    return fixed + (signer, rdata[end:])
+
+def rrsig_covers(sig):
+    return struct.unpack_from("!H", sig[2], 0)[0]
+
+def key_tag(dnskey):
+    """RFC 4034 Appendix B checksum identifying a DNSKEY."""
+    acc = sum(b << 8 if i % 2 == 0 else b for i, b in enumerate(dnskey))
+    return (acc + (acc >> 16)) & 0xFFFF
+
+def ds_digest(owner, dnskey, digest_type):
+    h = {1: hashlib.sha1, 2: hashlib.sha256}.get(digest_type)
+    return h(encode_domain(owner) + dnskey).digest() if h else None
+
+def make_ds(owner, dnskey, digest_type=2):
+    """DS rdata for a DNSKEY (used for trust anchors and by stub_dns.py)."""
+    return struct.pack("!HBB", key_tag(dnskey), dnskey[3], digest_type) + ds_digest(owner, dnskey, digest_type)
+
+def parse_anchor(text):
+    """(zone, DS rdata) from "zone keytag alg digest_type hexdigest"."""
+    zone, tag, alg, dtype, digest = text.split()
+    return canonical(zone), struct.pack("!HBB", int(tag), int(alg), int(dtype)) + bytes.fromhex(digest)
+
+def signed_data(rrsig, rrset):
+    """The bytes an RRSIG signs: its own rdata minus the signature, then the
+    RRset in canonical form and order (RFC 4034 §3.1.8.1, §6)."""
+    covered, alg, labels, ttl, expires, incept, tag, signer, _ = parse_rrsig(rrsig)
+    owner = rrset[0][0]
+    if labels < len(owner.split(".") if owner else []):  # expanded from a wildcard
+        owner = "*." + ".".join(owner.split(".")[-labels:]) if labels else "*"
+    head = encode_domain(owner) + struct.pack("!HHI", covered, 1, ttl)
+    rdatas = sorted({encode_rdata(r[1], r[2]) for r in rrset})
+    return (struct.pack("!HBBIIIH", covered, alg, labels, ttl, expires, incept, tag) + encode_domain(signer)
+            + b"".join(head + struct.pack("!H", len(rd)) + rd for rd in rdatas))
+
+def type_bitmap(data):
+    """Record types listed in an NSEC/NSEC3 type bitmap (RFC 4034 §4.1.2)."""
+    types, off = set(), 0
+    while off + 2 <= len(data):
+        window, length = data[off], data[off + 1]
+        for i, byte in enumerate(data[off + 2:off + 2 + length]):
+            types.update(window * 256 + i * 8 + bit for bit in range(8) if byte & 0x80 >> bit)
+        off += 2 + length
+    return types
+
+def make_type_bitmap(types):
+    """Type bitmap for an NSEC/NSEC3 (used by stub_dns.py)."""
+    out = b""
+    for window in sorted({t >> 8 for t in types}):
+        bits = bytearray(32)
+        for t in types:
+            if t >> 8 == window:
+                bits[(t & 0xFF) // 8] |= 0x80 >> (t & 7)
+        bits = bits.rstrip(b"\x00")
+        out += bytes([window, len(bits)]) + bits
+    return out
+
+def parse_nsec(rdata):
+    """(next owner name, types)"""
+    nxt, end = decode_domain(rdata, 0)
+    return nxt, type_bitmap(rdata[end:])
+
+def parse_nsec3(rdata):
+    """(hash algorithm, flags, iterations, salt, next hashed owner label, types)"""
+    alg, flags, iterations, salt_len = struct.unpack_from("!BBHB", rdata, 0)
+    salt, hash_len = rdata[5:5 + salt_len], rdata[5 + salt_len]
+    off = 6 + salt_len
+    nxt = base64.b32hexencode(rdata[off:off + hash_len]).decode().lower()
+    return alg, flags, iterations, salt, nxt, type_bitmap(rdata[off + hash_len:])
+
+def nsec3_hash(name, salt, iterations):
+    """RFC 5155 §5: the owner label of the NSEC3 for `name` (SHA-1, base32hex)."""
+    digest = hashlib.sha1(encode_domain(name) + salt).digest()
+    for _ in range(iterations):
+        digest = hashlib.sha1(digest + salt).digest()
+    return base64.b32hexencode(digest).decode().lower()
+
+def canonical_order(name):
+    """Sort key for RFC 4034 §6.1 canonical name order."""
+    return tuple(label.encode() for label in reversed(name.split("."))) if name else ()
+
+def covers(owner, nxt, key):
+    """True if `key` falls strictly between an NSEC(3)'s owner and next name;
+    the last one in a zone wraps around to the first."""
+    if owner < nxt:
+        return owner < key < nxt
+    return key > owner or key < nxt
+
+def is_below(name, zone):
+    return name != zone and (not zone or name.endswith("." + zone))
+
+# ---------------- Denial of existence ----------------
+# nsecs are (owner, next, types) and nsec3s (owner hash, flags, next hash,
+# types), already validated. Each proof returns SECURE when the denial is
+# proven, INSECURE when it may hide an unsigned (opt-out) delegation, else
+# BOGUS. An NSEC(3) at a delegation (NS without SOA) speaks for the parent
+# side only: it can deny the DS there, but nothing at or below the cut.
+
+def parent_side(types):
+    return T_DNAME in types or (T_NS in types and T_SOA not in types)
+
+def nodata_types_ok(types, qtype, cut=False):
+    """A matching NSEC(3) bitmap proves NODATA for `qtype`; with `cut`, also
+    that the name is a delegation (an unsigned one, when qtype is DS)."""
+    if qtype in types or T_CNAME in types or (cut and T_NS not in types):
+        return False
+    if qtype == T_DS:
+        return T_SOA not in types  # a child apex record cannot speak for the parent's DS
+    return not parent_side(types)
+
+def nsec_denial(name, qtype, nxdomain, nsecs, cut=False):
+    key = canonical_order(name)
+    matching = next((types for owner, _, types in nsecs if owner == name), None)
+    covering = [(owner, nxt) for owner, nxt, types in nsecs
+                if covers(canonical_order(owner), canonical_order(nxt), key)
+                and not (is_below(name, owner) and parent_side(types))]
+    if matching is not None:
+        return SECURE if not nxdomain and nodata_types_ok(matching, qtype, cut) else BOGUS
+    if cut or not covering:
+        return BOGUS
+    owner, nxt = covering[0]
+    if not nxdomain and is_below(nxt, name):
+        return SECURE  # empty non-terminal: names exist below it, records at it do not
+    # Closest encloser: the deepest ancestor of `name` the covering NSEC shows to exist
+    ce = max((common_ancestor(name, owner), common_ancestor(name, nxt)), key=len)
+    wildcard = "*." + ce if ce else "*"
+    if ce == name or not any(owner == wildcard or covers(canonical_order(owner), canonical_order(nxt),
+                                                          canonical_order(wildcard)) for owner, nxt, _ in nsecs):
+        return BOGUS
+    wild = next((types for owner, _, types in nsecs if owner == wildcard), None)
+    if nxdomain:
+        return SECURE if wild is None else BOGUS
+    return SECURE if wild is not None and nodata_types_ok(wild, qtype) else BOGUS
+
+def common_ancestor(a, b):
+    la, lb = a.split(".")[::-1] if a else [], b.split(".")[::-1] if b else []
+    n = 0
+    while n < min(len(la), len(lb)) and la[n] == lb[n]:
+        n += 1
+    return ".".join(reversed(la[:n]))
+
+def nsec3_denial(zone, name, qtype, nxdomain, nsec3s, salt, iterations, cut=False):
+    if iterations > NSEC3_MAX_ITERATIONS:
+        return BOGUS
+    hashes = {}
+
+    def lookup(n):
+        if n not in hashes:
+            hashes[n] = nsec3_hash(n, salt, iterations)
+        h = hashes[n]
+        match = next((types for owner, _, _, types in nsec3s if owner == h), None)
+        cover = next((flags for owner, flags, nxt, _ in nsec3s if covers(owner, nxt, h)), None)
+        return match, cover
+
+    matching, _ = lookup(name)
+    if matching is not None:
+        return SECURE if not nxdomain and nodata_types_ok(matching, qtype, cut) else BOGUS
+    # Closest encloser proof (RFC 5155 §8.3): an ancestor with an NSEC3, and the
+    # name one label below it (the next closer name) covered by another
+    labels = name.split(".")
+    for i in range(1, len(labels) + 1):
+        ce = ".".join(labels[i:])
+        if ce != zone and not is_below(ce, zone):
+            return BOGUS
+        types, _ = lookup(ce)
+        if types is None:
+            continue
+        if parent_side(types):
+            return BOGUS
+        _, flags = lookup(".".join(labels[i - 1:]))
+        if flags is None:
+            return BOGUS
+        opt_out = flags & 1
+        break
+    else:
+        return BOGUS
+    wild_types, wild_cover = lookup("*." + ce if ce else "*")
+    if nxdomain:
+        if wild_cover is None:
+            return BOGUS
+        return INSECURE if opt_out else SECURE
+    if qtype == T_DS and opt_out:
+        return INSECURE  # RFC 5155 §8.6: an unsigned delegation may be skipped by the chain
+    if cut:
+        return BOGUS
+    return SECURE if wild_types is not None and nodata_types_ok(wild_types, qtype) else BOGUS
+
+# ---------------- Signature algorithms ----------------
+SHA256_DIGEST_INFO = bytes.fromhex("3031300d060960864801650304020105000420")
+
+def rsa_public_key(key):
+    """(e, n) from RFC 3110 public key bytes."""
+    if key[0]:
+        elen, off = key[0], 1
+    else:
+        elen, off = struct.unpack_from("!H", key, 1)[0], 3
+    return int.from_bytes(key[off:off+elen], "big"), int.from_bytes(key[off+elen:], "big")
+
+def rsa_verify(key, data, signature):
+    e, n = rsa_public_key(key)
+    size = (n.bit_length() + 7) // 8
+    if len(signature) != size:
+        return False
+    em = pow(int.from_bytes(signature, "big"), e, n).to_bytes(size, "big")
+    tail = SHA256_DIGEST_INFO + hashlib.sha256(data).digest()
+    return em == b"\x00\x01" + b"\xff" * (size - len(tail) - 3) + b"\x00" + tail
+
+# NIST P-256 (affine coordinates, None is the point at infinity)
+P256_P = 0xFFFFFFFF00000001000000000000000000000000FFFFFFFFFFFFFFFFFFFFFFFF
+P256_A = P256_P - 3
+P256_B = 0x5AC635D8AA3A93E7B3EBBD55769886BC651D06B0CC53B0F63BCE3C3E27D2604B
+P256_N = 0xFFFFFFFF00000000FFFFFFFFFFFFFFFFBCE6FAADA7179E84F3B9CAC2FC632551
+P256_G = (0x6B17D1F2E12C4247F8BCE6E563A440F277037D812DEB33A0F4A13945D898C296,
+          0x4FE342E2FE1A7F9B8EE7EB4A7C0F9E162BCE33576B315ECECBB6406837BF51F5)
+
+def ec_add(p1, p2):
+    if p1 is None: return p2
+    if p2 is None: return p1
+    (x1, y1), (x2, y2) = p1, p2
+    if x1 == x2 and (y1 + y2) % P256_P == 0:
+        return None
+    if p1 == p2:
+        lam = (3 * x1 * x1 + P256_A) * pow(2 * y1, -1, P256_P)
+    else:
+        lam = (y2 - y1) * pow(x2 - x1, -1, P256_P)
+    x3 = (lam * lam - x1 - x2) % P256_P
+    return x3, (lam * (x1 - x3) - y1) % P256_P
+
+def ec_mul(k, point):
+    result = None
+    while k:
+        if k & 1:
+            result = ec_add(result, point)
+        point, k = ec_add(point, point), k >> 1
+    return result
+
+def ecdsa_verify(key, data, signature):
+    if len(key) != 64 or len(signature) != 64:
+        return False
+    q = (int.from_bytes(key[:32], "big"), int.from_bytes(key[32:], "big"))
+    if (q[1] ** 2 - q[0] ** 3 - P256_A * q[0] - P256_B) % P256_P:
+        return False  # not on the curve
+    r, s = int.from_bytes(signature[:32], "big"), int.from_bytes(signature[32:], "big")
+    if not (0 < r < P256_N and 0 < s < P256_N):
+        return False
+    z, w = int.from_bytes(hashlib.sha256(data).digest(), "big"), pow(s, -1, P256_N)
+    point = ec_add(ec_mul(z * w % P256_N, P256_G), ec_mul(r * w % P256_N, q))
+    return point is not None and point[0] % P256_N == r
+
+VERIFIERS = {ALG_RSASHA256: rsa_verify, ALG_ECDSAP256: ecdsa_verify}
+
+def verify_signature(alg, key, data, signature):
+    """Runs in the pool: `key` is the DNSKEY public key field."""
+    return VERIFIERS[alg](key, data, signature)
+
+def watch_parent(pid):
+    """Pool initializer: exit with the resolver even if it was killed outright."""
+    def watch():
+        while os.getppid() == pid:
+            time.sleep(1)
+        os._exit(0)
+    threading.Thread(target=watch, daemon=True).start()
+
+# ---------------- Validator ----------------
+class Validator:
+    def __init__(self, config, cache):
+        self.config, self.cache = config, cache
+        self.anchors = {}
+        for text in config.trust_anchors:
+            zone, ds = parse_anchor(text)
+            self.anchors.setdefault(zone, []).append(ds)
+        self.memo = {}
+        self.pool = None
+        if config.validator_workers > 0:
+            # spawn: forking a process full of threads can copy a held lock
+            self.pool = ProcessPoolExecutor(config.validator_workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=watch_parent, initargs=(os.getpid(),))
+
+    def check(self, task, ans, used, denial=None):
+        """Validate the answer RRsets behind `used` (the records a task is about
+        to return) and, for a negative answer, its `denial` (see check_denial).
+        Returns (status, detail, ms)."""
+        start = time.time()
+        sigs = [r for r in ans if r[1] == T_RRSIG]
+        rrsets = {}
+        for r in ans:
+            if r[1] != T_RRSIG:
+                rrsets.setdefault((r[0], r[1]), []).append(r)
+        wanted = {(r[0], r[1]) for r in used} | {k for k in rrsets if k[1] == T_DNAME}
+        status = SECURE
+        for (owner, rtype), rrset in rrsets.items():
+            if (owner, rtype) not in wanted:
+                continue
+            covering = [s for s in sigs if s[0] == owner and rrsig_covers(s) == rtype]
+            if not covering and rtype == T_CNAME and any(k[1] == T_DNAME for k in rrsets):
+                continue  # synthesized from a DNAME, which is validated instead
+            result = self.check_rrset(task, rrset, covering)
+            if result == BOGUS:
+                return BOGUS, owner, (time.time() - start) * 1000
+            if result == INSECURE:
+                status = INSECURE
+        if denial:
+            result = self.check_denial(task, task.qtype, denial)
+            if result == BOGUS:
+                return BOGUS, denial[1], (time.time() - start) * 1000
+            if result == INSECURE:
+                status = INSECURE
+        return status, "", (time.time() - start) * 1000
+
+    def check_denial(self, task, qtype, denial, cut=False):
+        """Status of a negative answer. `denial` is (authority section, name,
+        nxdomain, zone): from a signed zone it must hold the zone's signed SOA
+        and signed NSEC or NSEC3 records proving that `name` does not exist or
+        has no `qtype` records (and, with `cut`, that it is a delegation)."""
+        auth, name, nxdomain, zone = denial
+        # Proofs come from above: a zone cannot deny its own DS, and a name
+        # outside the zone cannot be denied by it
+        if not is_below(name, zone) and not (name == zone and qtype != T_DS):
+            return BOGUS
+        status, keys = self.zone_keys(task, zone)
+        if status != SECURE:
+            return status
+        rrsets, sigs = {}, {}
+        for r in auth:
+            if r[1] == T_RRSIG:
+                sigs.setdefault((r[0], rrsig_covers(r)), []).append(r)
+            elif r[1] in (T_SOA, T_NSEC, T_NSEC3) and (r[0] == zone or is_below(r[0], zone)):
+                rrsets.setdefault((r[0], r[1]), []).append(r)
+        if (zone, T_SOA) not in rrsets:
+            return BOGUS
+        nsecs, nsec3s = [], []
+        for (owner, rtype), rrset in rrsets.items():
+            # Wildcard-expanded copies of an NSEC(3) prove nothing
+            labels = len(owner.split(".")) if owner else 0
+            covering = [s for s in sigs.get((owner, rtype), []) if parse_rrsig(s[2])[2] == labels]
+            if not self.verify(rrset, covering, keys):
+                return BOGUS
+            if rtype == T_NSEC:
+                nsecs.append((owner,) + parse_nsec(rrset[0][2]))
+            elif rtype == T_NSEC3 and owner.partition(".")[2] == zone:
+                nsec3s.append((owner.partition(".")[0],) + parse_nsec3(rrset[0][2]))
+        if nsecs:
+            return nsec_denial(name, qtype, nxdomain, nsecs, cut)
+        params = next(((r[4], r[3]) for r in nsec3s if r[1] == 1), None)  # SHA-1 is the only hash defined
+        if params is None:
+            return BOGUS
+        nsec3s = [(owner, flags, nxt, types) for owner, alg, flags, iterations, salt, nxt, types in nsec3s
+                  if alg == 1 and (salt, iterations) == params]
+        return nsec3_denial(zone, name, qtype, nxdomain, nsec3s, *params, cut)
+
+    def check_rrset(self, task, rrset, sigs):
+        if not sigs:
+            # Unsigned data is only acceptable from a zone that is not signed
+            return INSECURE if self.zone_keys(task, task.zone)[0] == INSECURE else BOGUS
+        signer, owner = parse_rrsig(sigs[0][2])[7], rrset[0][0]
+        if signer and owner != signer and not owner.endswith("." + signer):
+            return BOGUS
+        status, keys = self.zone_keys(task, signer)
+        if status != SECURE:
+            return status
+        return SECURE if self.verify(rrset, sigs, keys) else BOGUS
+
+    def zone_keys(self, task, zone):
+        """(status, DNSKEY rdatas) for `zone`, walking up to a trust anchor."""
+        cached = self.cache.get("KEYS", zone)
+        if cached is not None:
+            return cached
+        if zone in self.anchors:
+            ds = self.anchors[zone]
+        elif not zone:
+            return INSECURE, []  # no trust anchor above this point
+        else:
+            records, sigs, denial = task.fetch(zone, T_DS)
+            if records is None:
+                return BOGUS, []
+            if not records:
+                # An unsigned delegation, if the parent proves there is no DS
+                # (or is unsigned itself); a parent proving the zone does not
+                # exist at all makes whatever led here bogus
+                denial = denial or ([], zone, False, zone.partition(".")[2])
+                status = self.check_denial(task, T_DS, denial, cut=True)
+                if status == BOGUS or (status == SECURE and denial[2]):
+                    return BOGUS, []
+                self.cache.put("KEYS", zone, (INSECURE, []))
+                return INSECURE, []
+            status, parent_keys = self.zone_keys(task, parse_rrsig(sigs[0][2])[7]) if sigs else (BOGUS, [])
+            if status != SECURE:
+                return status, []
+            if not self.verify(records, sigs, parent_keys):
+                return BOGUS, []
+            ds = [r[2] for r in records]
+
+        keys, sigs, _ = task.fetch(zone, T_DNSKEY)
+        if not keys:
+            return BOGUS, []
+        dnskeys = [r[2] for r in keys]
+        trusted = [k for k in dnskeys if any(struct.unpack_from("!HB", d) == (key_tag(k), k[3])
+                                             and ds_digest(zone, k, d[3]) == d[4:] for d in ds)]
+        if not trusted or not self.verify(keys, sigs, trusted):
+            return BOGUS, []
+        result = (SECURE, dnskeys)
+        self.cache.put("KEYS", zone, result)
+        return result
+
+    def verify(self, rrset, sigs, keys):
+        """True if one of `sigs` over `rrset` verifies with one of `keys`.
+        Candidate signatures are checked in parallel in the pool."""
+        now, jobs = int(time.time()), []
+        for sig in sigs:
+            covered, alg, _, _, expires, incept, tag, _, signature = parse_rrsig(sig[2])
+            if covered != rrset[0][1] or alg not in VERIFIERS or not incept <= now <= expires:
+                continue
+            for key in keys:
+                if key[3] != alg or key_tag(key) != tag:
+                    continue
+                data = signed_data(sig[2], rrset)
+                memo_key = hashlib.sha256(data + signature + key).digest()
+                if self.memo.get(memo_key):
+                    return True
+                if memo_key not in self.memo:
+                    jobs.append((memo_key, (alg, key[4:], data, signature)))
+        if self.pool:
+            results = zip(jobs, [self.pool.submit(verify_signature, *args) for _, args in jobs])
+            results = [(memo_key, f.result()) for (memo_key, _), f in results]
+        else:
+            results = [(memo_key, verify_signature(*args)) for memo_key, args in jobs]
+        if len(self.memo) > MEMO_SIZE:
+            self.memo.clear()
+        self.memo.update(results)
+        return any(ok for _, ok in results)
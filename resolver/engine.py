@@ -0,0 +1,170 @@
+"""
+The resolver engine: every query runs through a pipeline of stages
+(by default cache → resolve → reply → log) configured once at startup, so the
+cached and uncached resolvers are the same engine with different configs.
+
+A stage is a function stage(engine, query) that reads and fills in the
+Query; a stage that answers (e.g. a cache hit) sets query.rcode and later
+resolution stages leave it alone. Extra stages can be registered in STAGES
+and named in Config.pipeline.
+"""
+
+import csv, time, threading
+from dataclasses import dataclass, field
+
+from .cache import Cache, NullCache
+from .iterative import ResolutionTask
+from .wire import T_A, RCODE_OK, RCODE_SERVFAIL, canonical, first_value, rdata_text
+
+SUMMARY_HEADER = ["timestamp","client","domain","result_ip","total_time_ms","qtype","failure"]
+STEP_HEADER = ["timestamp","domain","resolution_mode","dns_server_ip","step","response_type","rtt_ms","total_time_ms","cache_status"]
+METRICS_HEADER = ["Total Queries","Success","Failed","Avg Latency (ms)","Throughput (qps)","% Cache Resolved",
+                  "Shed","Rate Limited"]
+
+@dataclass
+class Query:
+    qname: str
+    qtype: int = T_A
+    client: str = "-"
+    ts: str = ""
+    start: float = field(default_factory=time.time)
+    name: str = ""          # name still to resolve: qname, or the end of a cached CNAME chain
+    chain: list = field(default_factory=list)  # CNAME links already known
+    records: list = field(default_factory=list)
+    rcode: int = None       # set once some stage has answered
+    steps: list = field(default_factory=list)
+    cache_hit: bool = False
+    failure: tuple = None   # (reason, detail) when the query was abandoned
+    total_ms: float = 0.0
+    reply: object = None    # callable(query) that sends the answer to the client
+
+    @property
+    def result(self):
+        if self.rcode != RCODE_OK:
+            return "FAIL"
+        value = first_value(self.records, self.qtype)
+        return "NODATA" if value is None else rdata_text(value)
+
+# ---------------- Stages ----------------
+def cache_stage(engine, q):
+    chain, q.name, cached = engine.cache.chain(q.qname, q.qtype)
+    if cached is not None:
+        total_ms = (time.time() - q.start) * 1000
+        q.steps.append((q.qname, "cached", "cache", "CACHE", "ANSWER", "0.00", f"{total_ms:.2f}", "HIT"))
+        q.records, q.rcode, q.cache_hit = chain + cached, RCODE_OK, True
+    elif chain:
+        q.steps.append((q.qname, "cached", "cache", "CACHE", "CNAME", "0.00", "-", "HIT"))
+        q.chain = chain
+
+def resolve_stage(engine, q):
+    if q.rcode is not None:
+        return
+    task = ResolutionTask(engine, q.name or q.qname, q.qtype, log_name=q.qname)
+    records, q.rcode, steps = task.run()
+    q.records, q.failure = q.chain + records, task.failure
+    if q.rcode != RCODE_SERVFAIL and steps:
+        total_ms = (time.time() - q.start) * 1000
+        steps[-1] = steps[-1][:6] + (f"{total_ms:.2f}",) + steps[-1][7:]
+    q.steps += steps
+
+def reply_stage(engine, q):
+    if q.rcode is None:
+        q.rcode = RCODE_SERVFAIL
+    q.total_ms = (time.time() - q.start) * 1000
+    if q.reply:
+        q.reply(q)
+
+def log_stage(engine, q):
+    c = engine.config
+    with engine.log_lock:
+        with open(c.summary_file, "a", newline="") as f:
+            csv.writer(f).writerow([q.ts, q.client, q.qname, q.result, f"{q.total_ms:.2f}", q.qtype,
+                                    ":".join(q.failure) if q.failure else ""])
+        with open(c.step_file, "a", newline="") as f:
+            w = csv.writer(f)
+            for s in q.steps:
+                w.writerow([q.ts] + list(s))
+        engine.update_metrics(q.rcode == RCODE_OK, q.total_ms, q.cache_hit)
+
+STAGES = {"cache": cache_stage, "resolve": resolve_stage, "reply": reply_stage, "log": log_stage}
+
+# ---------------- Engine ----------------
+class Engine:
+    def __init__(self, config):
+        self.config = config
+        self.cache = Cache(config.cache_ttl) if config.cache else NullCache()
+        self.stages = [STAGES[name] for name in config.pipeline if name != "cache" or config.cache]
+        self.pool, self.pool_lock = None, threading.Lock()
+        self.dnssec = None
+        self.stats = {
+            "total_queries": 0,
+            "success": 0,
+            "fail": 0,
+            "cache_hits": 0,
+            "shed": 0,
+            "rate_limited": 0,
+            "total_latency": 0.0,
+            "start_time": time.time()
+        }
+        self.log_lock = threading.Lock()  # stats and the CSV logs are shared by the workers
+
+    def resolve(self, qname, qtype=T_A, client="-", ts="", reply=None):
+        q = Query(canonical(qname), qtype, client, ts, reply=reply)
+        for stage in self.stages:
+            stage(self, q)
+        if q.rcode is None:
+            q.rcode = RCODE_SERVFAIL
+        if not q.total_ms:
+            q.total_ms = (time.time() - q.start) * 1000
+        return q
+
+    def upstream_pool(self):
+        # Imported on first use so iterative-only servers never load ssl/http
+        with self.pool_lock:
+            if self.pool is None:
+                from .forward import UpstreamPool
+                self.pool = UpstreamPool(self.config.upstreams, self.config.query_timeout,
+                                         self.config.tls_cafile or None)
+        return self.pool
+
+    def validator(self):
+        with self.pool_lock:
+            if self.dnssec is None:
+                from .dnssec import Validator
+                self.dnssec = Validator(self.config, self.cache)
+        return self.dnssec
+
+    def init_logs(self):
+        c = self.config
+        for fpath, header in [(c.summary_file, SUMMARY_HEADER), (c.step_file, STEP_HEADER),
+                              (c.metrics_file, METRICS_HEADER)]:
+            with open(fpath, "w", newline="") as f:
+                csv.writer(f).writerow(header)
+
+    def update_metrics(self, success, total_time, cache_hit):
+        """Called with log_lock held."""
+        stats = self.stats
+        stats["total_queries"] += 1
+        if success:
+            stats["success"] += 1
+            stats["total_latency"] += total_time
+        else:
+            stats["fail"] += 1
+        if cache_hit:
+            stats["cache_hits"] += 1
+        self.write_metrics()
+
+    def write_metrics(self):
+        """Rewrite the metrics file from stats; called with log_lock held."""
+        stats = self.stats
+        avg_latency = stats["total_latency"]/stats["success"] if stats["success"] else 0
+        elapsed = time.time() - stats["start_time"]
+        throughput = stats["total_queries"]/elapsed if elapsed else 0
+        cache_pct = (stats["cache_hits"]/stats["total_queries"])*100 if stats["total_queries"] else 0
+
+        with open(self.config.metrics_file, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(METRICS_HEADER)
+            w.writerow([stats["total_queries"],stats["success"],stats["fail"],
+                        f"{avg_latency:.2f}",f"{throughput:.2f}",f"{cache_pct:.2f}",
+                        stats["shed"],stats["rate_limited"]])
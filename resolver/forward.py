@@ -0,0 +1,254 @@
+"""
+Upstream forwarding
+-------------------
+Used by the engine when Config.mode is "forward": cache misses are sent to a
+list of upstream resolvers instead of being walked down from the root.
+
+Upstreams are given as URLs:
+    udp://8.8.8.8:53
+    tcp://8.8.8.8:53
+    tls://1.1.1.1:853#cloudflare-dns.com   (fragment = name checked against the certificate)
+    https://dns.google/dns-query           (DNS-over-HTTPS, RFC 8484 POST)
+
+TCP and TLS upstreams keep one persistent connection each and pipeline every
+in-flight query on it; DoH keeps a small pool of keep-alive connections.
+The pool tracks a smoothed RTT per upstream, prefers the fastest idle one,
+takes upstreams out of rotation after repeated failures and probes them in
+the background until they answer again.
+"""
+
+import socket, ssl, struct, time, random, threading
+import http.client
+from urllib.parse import urlsplit
+
+from .wire import recv_exact
+
+QUERY_TIMEOUT = 3      # seconds per upstream exchange
+MAX_FAILS = 3          # consecutive failures before an upstream is marked down
+HEALTH_INTERVAL = 10   # seconds between probes of down upstreams
+RTT_ALPHA = 0.3        # weight of the newest sample in the smoothed RTT
+DOH_POOL_SIZE = 4      # idle keep-alive connections kept per DoH upstream
+
+# ". IN NS" — cheap query every resolver can answer, used as health probe
+PROBE = struct.pack("!HHHHHH", 0, 0x0100, 1, 0, 0, 0) + b"\x00" + struct.pack("!HH", 2, 1)
+
+def tls_context(cafile=None):
+    """Default TLS context, also trusting `cafile` (e.g. a local stub's certificate)."""
+    ctx = ssl.create_default_context()
+    if cafile:
+        ctx.load_verify_locations(cafile)
+    return ctx
+
+# ---------------- Transports ----------------
+class UdpUpstream:
+    def __init__(self, host, port):
+        self.addr = (host, port or 53)
+
+    def exchange(self, data, timeout):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.settimeout(timeout)
+        try:
+            s.sendto(data, self.addr)
+            deadline = time.time() + timeout
+            while True:
+                resp, src = s.recvfrom(65535)
+                if src[1] == self.addr[1] and resp[:2] == data[:2]:
+                    return resp
+                s.settimeout(max(deadline - time.time(), 0.001))
+        except OSError:
+            return None
+        finally:
+            s.close()
+
+    def close(self):
+        pass
+
+class StreamUpstream:
+    """One persistent TCP (or TLS) connection carrying pipelined queries.
+
+    Each query is given a connection-unique ID on the wire, so responses can
+    come back in any order; a reader thread hands them to the waiting callers.
+    """
+
+    def __init__(self, host, port, server_name=None, timeout=QUERY_TIMEOUT, cafile=None):
+        self.addr = (host, port)
+        self.server_name = server_name  # TLS when set
+        self.timeout, self.cafile = timeout, cafile
+        self.sock = None
+        self.pending = {}               # wire ID → [event, response]
+        self.lock = threading.Lock()
+
+    def connect(self):
+        sock = socket.create_connection(self.addr, timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.server_name:
+            sock = tls_context(self.cafile).wrap_socket(sock, server_hostname=self.server_name)
+        sock.settimeout(None)
+        threading.Thread(target=self.reader, args=(sock,), daemon=True).start()
+        return sock
+
+    def reader(self, sock):
+        try:
+            while True:
+                length = struct.unpack("!H", recv_exact(sock, 2))[0]
+                resp = recv_exact(sock, length)
+                with self.lock:
+                    waiter = self.pending.pop(resp[:2], None)
+                if waiter:
+                    waiter[1] = resp
+                    waiter[0].set()
+        except (OSError, ValueError, struct.error):
+            pass
+        self.drop(sock)
+
+    def drop(self, sock):
+        """Forget a dead connection and wake everyone still waiting on it."""
+        with self.lock:
+            if self.sock is not sock:
+                return
+            self.sock = None
+            waiters, self.pending = self.pending, {}
+        for waiter in waiters.values():
+            waiter[0].set()
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    def exchange(self, data, timeout):
+        for _ in range(2):  # the server may have closed an idle connection
+            waiter = [threading.Event(), None]
+            with self.lock:
+                sock = self.sock
+                try:
+                    if sock is None:
+                        sock = self.sock = self.connect()
+                    wire_id = struct.pack("!H", random.randint(0, 0xFFFF))
+                    while wire_id in self.pending:
+                        wire_id = struct.pack("!H", random.randint(0, 0xFFFF))
+                    self.pending[wire_id] = waiter
+                    sock.sendall(struct.pack("!H", len(data)) + wire_id + data[2:])
+                    break
+                except OSError:
+                    pass
+            if sock:
+                self.drop(sock)
+        else:
+            return None
+        if not waiter[0].wait(timeout):
+            with self.lock:
+                self.pending.pop(wire_id, None)
+            return None
+        resp = waiter[1]
+        return data[:2] + resp[2:] if resp else None
+
+    def close(self):
+        if self.sock:
+            self.drop(self.sock)
+
+class DohUpstream:
+    """DNS-over-HTTPS via POST, reusing keep-alive connections."""
+
+    def __init__(self, host, port, path, cafile=None):
+        self.host, self.port, self.path = host, port or 443, path or "/dns-query"
+        self.cafile = cafile
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def exchange(self, data, timeout):
+        with self.lock:
+            conn = self.idle.pop() if self.idle else None
+        if conn is None:
+            conn = http.client.HTTPSConnection(self.host, self.port, timeout=timeout, context=tls_context(self.cafile))
+        try:
+            conn.timeout = timeout
+            if conn.sock:
+                conn.sock.settimeout(timeout)
+            # ID 0 keeps responses cacheable by HTTP intermediaries (RFC 8484 §4.1)
+            conn.request("POST", self.path, b"\x00\x00" + data[2:],
+                         {"Content-Type": "application/dns-message", "Accept": "application/dns-message"})
+            r = conn.getresponse()
+            body = r.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            return None
+        with self.lock:
+            if len(self.idle) < DOH_POOL_SIZE and not r.will_close:
+                self.idle.append(conn)
+            else:
+                conn.close()
+        if r.status != 200 or len(body) < 12:
+            return None
+        return data[:2] + body[2:]
+
+    def close(self):
+        with self.lock:
+            for conn in self.idle:
+                conn.close()
+            self.idle = []
+
+def make_upstream(url, timeout=QUERY_TIMEOUT, cafile=None):
+    u = urlsplit(url)
+    if u.scheme == "udp":
+        return UdpUpstream(u.hostname, u.port)
+    if u.scheme == "tcp":
+        return StreamUpstream(u.hostname, u.port or 53, timeout=timeout)
+    if u.scheme == "tls":
+        return StreamUpstream(u.hostname, u.port or 853, u.fragment or u.hostname, timeout, cafile)
+    if u.scheme == "https":
+        return DohUpstream(u.hostname, u.port, u.path, cafile)
+    raise ValueError(f"unsupported upstream: {url}")
+
+# ---------------- Pool ----------------
+class UpstreamPool:
+    def __init__(self, urls, timeout=QUERY_TIMEOUT, cafile=None):
+        self.timeout = timeout
+        self.upstreams = {url: {
+            "conn": make_upstream(url, timeout, cafile),
+            "rtt": 50.0,       # smoothed RTT (ms); optimistic until measured
+            "inflight": 0,
+            "fails": 0,
+            "down": False,
+        } for url in urls}
+        self.lock = threading.Lock()
+        threading.Thread(target=self.health_check, daemon=True).start()
+
+    def candidates(self):
+        """Upstream URLs in the order to try them: healthy ones by expected
+        latency under their current load, then the ones marked down."""
+        with self.lock:
+            return sorted(self.upstreams, key=lambda url: (
+                self.upstreams[url]["down"],
+                self.upstreams[url]["rtt"] * (self.upstreams[url]["inflight"] + 1),
+                random.random()))
+
+    def exchange(self, url, data, timeout=None):
+        """Send one query; returns (response, rtt_ms), both None on failure.
+        `timeout` defaults to the pool's."""
+        upstream = self.upstreams[url]
+        timeout = timeout or self.timeout
+        with self.lock:
+            upstream["inflight"] += 1
+        start = time.time()
+        resp = upstream["conn"].exchange(data, timeout)
+        rtt = (time.time() - start) * 1000
+        with self.lock:
+            upstream["inflight"] -= 1
+            if resp:
+                upstream["rtt"] += RTT_ALPHA * (rtt - upstream["rtt"])
+                upstream["fails"], upstream["down"] = 0, False
+            else:
+                upstream["fails"] += 1
+                upstream["down"] = upstream["fails"] >= MAX_FAILS
+        return (resp, rtt) if resp else (None, None)
+
+    def health_check(self):
+        while True:
+            time.sleep(HEALTH_INTERVAL)
+            for url in [url for url, u in self.upstreams.items() if u["down"]]:
+                probe = struct.pack("!H", random.randint(0, 0xFFFF)) + PROBE[2:]
+                self.exchange(url, probe)
+
+    def close(self):
+        for upstream in self.upstreams.values():
+            upstream["conn"].close()
@@ -0,0 +1,283 @@
+"""
+Iterative resolution state machine with a per-query work budget.
+"""
+
+import time, threading, queue
+
+from .wire import (T_A, T_NS, T_SOA, RCODE_OK, RCODE_SERVFAIL, RCODE_NXDOMAIN, MAX_CHAIN,
+                   T_RRSIG, canonical, rr_key, randomize_case, build_query, send_query, send_tcp_query,
+                   matches_query, truncated, parse_response, response_status, follow_chain, first_value)
+
+class Budget:
+    """Work allowance shared by a client query and every NS lookup it spawns."""
+
+    def __init__(self, config):
+        self.config = config
+        self.deadline = time.time() + config.max_time
+        self.queries = 0
+        self.asked = set()  # (server, rr_key) already sent for this client query
+        self.lock = threading.Lock()
+
+    def remaining(self):
+        return self.deadline - time.time()
+
+    def spend(self, srv, name, qtype, again=False):
+        """Reserve one upstream query; returns why it was refused, or None.
+        `again` lets a (server, name) that was already asked be asked once more."""
+        with self.lock:
+            if self.remaining() <= 0:
+                return "TIME_BUDGET"
+            if self.queries >= self.config.max_queries:
+                return "QUERY_BUDGET"
+            key = (srv, rr_key(name, qtype))
+            if key in self.asked and not again:
+                return "REPEAT"
+            self.asked.add(key)
+            self.queries += 1
+        return None
+
+class ResolutionTask:
+    """One (name, qtype) lookup as an explicit state machine over a server queue.
+
+    Glueless NS names become child tasks that run in parallel, draw from the
+    same Budget and are cancelled as soon as one of them yields an address.
+    When the task gives up, `failure` holds a (reason, detail) pair.
+
+    With DNSSEC on, answers are validated before they are cached or returned;
+    the DS/DNSKEY lookups this needs are child tasks on the same Budget.
+    """
+
+    def __init__(self, engine, domain, qtype=T_A, budget=None, depth=0, lineage=(), cancels=(), log_name=None,
+                 validate=True):
+        self.engine, self.config, self.cache = engine, engine.config, engine.cache
+        self.domain, self.qtype = domain, qtype
+        self.log_name = log_name or domain  # domain column of the step log
+        self.budget = budget or Budget(self.config)
+        self.depth = depth
+        self.lineage = lineage + (canonical(domain),)  # names being resolved above this task
+        self.cancels = cancels
+        self.failure = None
+        self.outcome = None  # response type of the final answer (ANSWER, NXDOMAIN or NODATA)
+        self.steps = []  # step-log rows, including those of child lookups
+        self.validate = validate and self.config.dnssec and self.config.mode == "iterative"
+        # Clients are served from the RR/CNAME levels, so with DNSSEC on only validated data goes there
+        self.cacheable = self.validate or not self.config.dnssec
+        self.zone = ""   # zone of the servers being asked, from the last referral
+        self.sigs = []   # RRSIGs that came with the final answer
+        self.denial = None  # (authority, name, nxdomain, zone) of a negative final answer
+
+    def fail(self, reason, detail=""):
+        if self.failure is None:
+            self.failure = (reason, detail)
+
+    def cancelled(self):
+        return any(e.is_set() for e in self.cancels)
+
+    def run(self):
+        """Resolve from the top. Returns (records, rcode, steps); the answering
+        step's total_time_ms is left for the caller, which knows the start time."""
+        domain, name, qtype = self.log_name, self.domain, self.qtype
+        cache, config = self.cache, self.config
+        steps, chain = self.steps, []
+
+        servers = self.first_servers()
+        visited = set()
+        cache_status = "MISS" if config.cache else "N/A"
+
+        while servers:
+            if self.cancelled():
+                self.fail("CANCELLED", name)
+                break
+            srv = servers.pop(0)
+            if srv in visited:
+                continue
+            visited.add(srv)
+            refused = self.budget.spend(srv, name, qtype)
+            if refused == "REPEAT":
+                continue
+            if refused:
+                self.fail(refused, name)
+                break
+
+            query = build_query(randomize_case(name) if config.case_randomization else name, qtype,
+                                dnssec=config.dnssec)
+            stage, resp, rtt = self.send(srv, query)
+            mismatch = bool(resp) and not matches_query(query, resp)
+            if (mismatch and config.case_randomization and matches_query(query, resp, ignore_case=True)
+                    and not self.budget.spend(srv, name, qtype, again=True)):
+                # Right ID and name but not our letter case: the server does not
+                # preserve case, so ask it once more without 0x20
+                steps.append((domain, config.mode, srv, stage, "CASE_MISMATCH", f"{rtt:.2f}", "-", cache_status))
+                query = build_query(name, qtype, dnssec=config.dnssec)
+                stage, resp, rtt = self.send(srv, query)
+                mismatch = bool(resp) and not matches_query(query, resp)
+            if resp and not mismatch and truncated(resp):
+                # Partial answer: ask the same server again over TCP. A forwarder's
+                # UDP upstream is just skipped (its TCP/TLS upstreams never truncate)
+                steps.append((domain, config.mode, srv, stage, "TRUNCATED", f"{rtt:.2f}", "-", cache_status))
+                resp, rtt = None, None
+                if config.mode == "iterative" and not self.budget.spend(srv, name, qtype, again=True):
+                    stage, resp, rtt = self.send(srv, query, tcp=True)
+                    mismatch = bool(resp) and not matches_query(query, resp)
+            rtt_ms = f"{rtt:.2f}" if rtt else "timeout"
+            if mismatch:
+                resp = None  # stray or spoofed: treated as no answer from this server
+
+            ans, auth, add = parse_response(resp)
+            rcode, authoritative = response_status(resp)
+            links, target, records = follow_chain(ans, name, qtype)
+            ns_names = [r[2] for r in auth if r[1] == T_NS]
+
+            if mismatch:
+                response_type = "MISMATCH"
+            elif not resp:
+                response_type = "NO_RESPONSE"
+            elif records:
+                response_type = "ANSWER"
+            elif links:
+                response_type = "CNAME"
+            elif rcode == RCODE_NXDOMAIN:
+                response_type = "NXDOMAIN"
+            elif rcode == RCODE_OK and (authoritative or not ns_names):
+                response_type = "NODATA"
+            elif rcode != RCODE_OK:
+                response_type = "ERROR"
+            else:
+                response_type = "REFERRAL"
+
+            steps.append((domain, config.mode, srv, stage, response_type, rtt_ms, "-", cache_status))
+
+            self.denial = None
+            if response_type in ("NXDOMAIN", "NODATA"):
+                zone = next((r[0] for r in auth if r[1] == T_SOA), self.zone)
+                self.denial = (auth, canonical(target), response_type == "NXDOMAIN", zone)
+            if self.validate and response_type in ("ANSWER", "CNAME", "NXDOMAIN", "NODATA"):
+                status, detail, ms = self.engine.validator().check(self, ans, links + records, self.denial)
+                steps.append((domain, config.mode, "validator", "DNSSEC", status, f"{ms:.2f}", "-", cache_status))
+                if status == "BOGUS":
+                    self.fail("DNSSEC_BOGUS", detail)
+                    continue  # never cached; another server may hold good data
+
+            # Case 1: final answer (possibly at the end of an in-response chain)
+            if response_type in ("ANSWER", "NXDOMAIN", "NODATA"):
+                for link in links if self.cacheable else []:
+                    cache.put("CNAME", link[0], link[2])
+                if records and self.cacheable:
+                    cache.put("RR", (target, qtype), records)
+                self.sigs = [r for r in ans if r[1] == T_RRSIG]
+                self.failure, self.outcome = None, response_type
+                return chain + links + records, rcode, steps
+
+            # Case 2: alias — cache each link, then restart from the canonical name
+            if response_type == "CNAME":
+                for link in links if self.cacheable else []:
+                    cache.put("CNAME", link[0], link[2])
+                more, name, cached = cache.chain(target, qtype)
+                seen = {r[0].lower() for r in chain + links}
+                chain += links + more
+                if name.lower() in seen:
+                    self.fail("CNAME_LOOP", name)
+                    break
+                if len(chain) > MAX_CHAIN:
+                    self.fail("CHAIN_LENGTH", name)
+                    break
+                if cached is not None:
+                    steps.append((domain, "cached", "cache", "CACHE", "ANSWER", "0.00", "-", "HIT"))
+                    self.failure, self.outcome = None, "ANSWER"
+                    return chain + cached, RCODE_OK, steps
+                servers, visited, self.zone = self.first_servers(), set(), ""
+                continue
+
+            # Upstreams are recursive, and a failed server is replaced by the
+            # next one at its level: anything but a referral means try the next
+            if config.mode == "forward" or response_type != "REFERRAL":
+                continue
+
+            # Case 3: Referral. The child zone's servers replace the rest of
+            # this level, which would only hand out the same referral again.
+            self.zone = next(r[0] for r in auth if r[1] == T_NS)
+            glue = [r for r in add if r[1] == T_A and r[0].lower() in {ns.lower() for ns in ns_names}]
+            if glue:
+                for r in glue:
+                    cache.put("GLUE", r[0], r[2])
+                servers = [r[2] for r in glue]
+                continue
+
+            cache.put("NS", self.zone, ns_names)
+            ns_ip = self.resolve_ns(ns_names)
+            servers = [ns_ip] if ns_ip else []
+        else:
+            self.fail("SERVERS_EXHAUSTED", name)
+
+        return chain, RCODE_SERVFAIL, steps
+
+    def send(self, srv, query, tcp=False):
+        """One exchange with `srv`; returns (log stage, response, rtt_ms)."""
+        config = self.config
+        timeout = min(config.query_timeout, self.budget.remaining())
+        if config.mode == "forward":
+            return ("FORWARDER",) + self.engine.upstream_pool().exchange(srv, query, timeout)
+        stage = "ROOT" if srv in config.root_servers else "TLD/AUTH"
+        return (stage,) + (send_tcp_query if tcp else send_query)(srv, query, timeout, config.dns_port)
+
+    def resolve_ns(self, ns_names):
+        """Address of whichever of `ns_names` resolves first.
+
+        Cached glue is used directly. Otherwise up to NS_FANOUT names are
+        looked up in parallel; the first address wins and the rest are cancelled.
+        """
+        for ns in ns_names:
+            ip = self.cache.get("GLUE", ns) or first_value(self.cache.get("RR", (ns, T_A)) or [], T_A)
+            if ip:
+                return ip
+        if self.depth >= self.config.max_depth:
+            self.fail("DEPTH_LIMIT", ns_names[0])
+            return None
+        candidates = [ns for ns in ns_names if canonical(ns) not in self.lineage][:self.config.ns_fanout]
+        if not candidates:
+            self.fail("NS_LOOP", ns_names[0])
+            return None
+
+        stop, results = threading.Event(), queue.Queue()
+        children = [ResolutionTask(self.engine, ns, T_A, self.budget, self.depth + 1, self.lineage, self.cancels + (stop,),
+                                   log_name=self.log_name, validate=False) for ns in candidates]
+        for child in children:
+            threading.Thread(target=lambda c=child: results.put((c, c.run()[0])), daemon=True).start()
+
+        ip = None
+        for _ in children:
+            try:
+                winner, records = results.get(timeout=max(self.budget.remaining(), 0))
+            except queue.Empty:
+                break
+            ip = first_value(records, T_A)
+            if ip:
+                break
+        stop.set()
+        # Every query sent on our behalf shows up in the step log (cancelled
+        # children may still add a row they were already waiting on)
+        self.steps += [step for c in children for step in list(c.steps)]
+        if ip:
+            self.cache.put("GLUE", winner.domain, ip)
+        else:
+            outcomes = (c.failure[0] if c.failure else c.outcome or "UNFINISHED" for c in children)
+            self.fail("NO_NS_ADDRESS", " ".join(f"{c.domain}={o}" for c, o in zip(children, outcomes)))
+        return ip
+
+    def fetch(self, zone, rtype):
+        """DNSKEY/DS RRset of `zone`, its RRSIGs and, if there is none, the
+        lookup's denial; all unvalidated (the caller checks them). records is
+        None if the lookup failed."""
+        child = ResolutionTask(self.engine, zone, rtype, self.budget, self.depth, self.lineage, self.cancels,
+                               log_name=self.log_name, validate=False)
+        records, rcode, steps = child.run()
+        self.steps += steps
+        if rcode == RCODE_SERVFAIL:
+            return None, [], None
+        return [r for r in records if r[0] == zone and r[1] == rtype], child.sigs, child.denial
+
+    def first_servers(self):
+        """Where a lookup (or a restart after a CNAME) begins in the current mode."""
+        if self.config.mode == "forward":
+            return self.engine.upstream_pool().candidates()
+        return self.config.root_servers[:]
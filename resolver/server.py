@@ -0,0 +1,139 @@
+"""
+UDP and TCP front end: admission control in the receive loops, resolution
+on a fixed pool of worker threads behind a bounded queue. TCP is there for
+clients whose UDP answer was truncated (TC set).
+"""
+
+import socket, struct, time, threading, queue
+from collections import OrderedDict
+
+from .config import load_config
+from .engine import Engine
+from .wire import BUFFER_SIZE, RCODE_SERVFAIL, rr_key, parse_question, build_reply, recv_exact
+
+TCP_IDLE_TIMEOUT = 10  # seconds a client connection may sit without a query
+METRICS_INTERVAL = 1   # seconds between metrics flushes of the refusal counters
+
+# ---------------- Admission control ----------------
+def admit(buckets, key, rate, burst, max_buckets):
+    """Token bucket check: take one token from `key`'s bucket if there is one.
+    `buckets` is an OrderedDict kept in least-recently-seen order, so a full
+    table drops its stalest bucket in O(1)."""
+    now = time.time()
+    tokens, ts = buckets.pop(key, (burst, now))
+    tokens = min(burst, tokens + (now - ts) * rate)
+    allowed = tokens >= 1
+    buckets[key] = (tokens - 1 if allowed else tokens, now)
+    if len(buckets) > max_buckets:
+        buckets.popitem(last=False)
+    return allowed
+
+def refuse(engine, send, data, q_end, tcp, counter):
+    """Count a request turned away before resolution; answer SERVFAIL unless dropping."""
+    with engine.log_lock:
+        engine.stats[counter] += 1
+    if engine.config.shed_action == "servfail":
+        send(build_reply(data, q_end, [], RCODE_SERVFAIL, tcp))
+
+def flush_metrics(engine, interval=METRICS_INTERVAL):
+    """Refused requests never reach the log stage, which is what rewrites the
+    metrics file, so during an overload their counters are flushed from here."""
+    written = None
+    while True:
+        time.sleep(interval)
+        with engine.log_lock:
+            counts = engine.stats["shed"], engine.stats["rate_limited"]
+            if counts != written:
+                engine.write_metrics()
+                written = counts
+
+# ---------------- Server ----------------
+def handle_query(engine, send, data, addr, tcp, ts, qname, qtype, q_end):
+    print(f"[Query] {addr[0]} asked for {qname} (type {qtype}){' over TCP' if tcp else ''}")
+    reply = lambda q: send(build_reply(data, q_end, q.records, q.rcode, tcp))
+    q = engine.resolve(qname, qtype, addr[0], ts, reply)
+    print(f"[Done] {qname} -> {q.result} ({q.total_ms:.2f} ms){' ' + q.failure[0] if q.failure else ''}\n")
+
+def worker(engine, requests):
+    while True:
+        data, addr, send, tcp, ts, arrived, qname, qtype, q_end = requests.get()
+        if time.time() - arrived > engine.config.queue_max_wait:
+            refuse(engine, send, data, q_end, tcp, "shed")
+            continue
+        try:
+            handle_query(engine, send, data, addr, tcp, ts, qname, qtype, q_end)
+        except Exception as e:
+            print(f"[Error] {qname}: {e}")
+
+def serve_tcp(sock, submit):
+    while True:
+        conn, addr = sock.accept()
+        threading.Thread(target=serve_connection, args=(conn, addr, submit), daemon=True).start()
+
+def serve_connection(conn, addr, submit):
+    """One TCP client: each length-prefixed query goes through admission like
+    a UDP one; replies are written back in whatever order they finish."""
+    lock = threading.Lock()
+    def send(reply):
+        with lock:
+            try:
+                conn.sendall(struct.pack("!H", len(reply)) + reply)
+            except OSError:
+                pass
+    conn.settimeout(TCP_IDLE_TIMEOUT)
+    try:
+        while True:
+            submit(recv_exact(conn, struct.unpack("!H", recv_exact(conn, 2))[0]), addr, send, True)
+    except (OSError, ValueError, struct.error):
+        pass
+    conn.close()
+
+def start_server(engine, banner="Resolver"):
+    c = engine.config
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((c.server_ip, c.server_port))
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((c.server_ip, c.server_port))
+    listener.listen(64)
+    print(f"[+] {banner} ({c.mode}, cache {'on' if c.cache else 'off'}) running on {c.server_ip}:{c.server_port}")
+    engine.init_logs()
+    threading.Thread(target=flush_metrics, args=(engine,), daemon=True).start()
+
+    # Bounded queue in front of a fixed worker pool: when it is full we shed
+    # instead of letting every client's latency grow with the backlog.
+    requests = queue.Queue(maxsize=c.queue_size)
+    for _ in range(c.workers):
+        threading.Thread(target=worker, args=(engine, requests), daemon=True).start()
+    client_buckets, qname_buckets = OrderedDict(), OrderedDict()
+    admission = threading.Lock()  # the buckets are shared with the TCP connections
+
+    def submit(data, addr, send, tcp=False):
+        client = addr[0]
+        ts = time.strftime("%Y-%m-%d %H:%M:%S")
+
+        try:
+            qname, qtype, _, q_end = parse_question(data, 12)
+        except Exception:
+            return
+
+        with admission:
+            allowed = admit(client_buckets, client, c.client_rate, c.client_burst, c.max_buckets)
+            # Only names that need upstream work are limited; cache hits are cheap
+            if allowed and engine.cache.chain(qname, qtype)[2] is None:
+                allowed = admit(qname_buckets, rr_key(qname, qtype), c.qname_rate, c.qname_burst, c.max_buckets)
+        if not allowed:
+            refuse(engine, send, data, q_end, tcp, "rate_limited")
+            return
+        try:
+            requests.put_nowait((data, addr, send, tcp, ts, time.time(), qname, qtype, q_end))
+        except queue.Full:
+            refuse(engine, send, data, q_end, tcp, "shed")
+
+    threading.Thread(target=serve_tcp, args=(listener, submit), daemon=True).start()
+    while True:
+        data, addr = sock.recvfrom(BUFFER_SIZE)
+        submit(data, addr, lambda reply, addr=addr: sock.sendto(reply, addr))
+
+def main(argv=None, banner="Resolver", **defaults):
+    start_server(Engine(load_config(argv, **defaults)), banner)
@@ -0,0 +1,250 @@
+"""
+DNS wire format: names, questions, queries, resource records and replies.
+
+Records are (name, rtype, value) tuples. A, AAAA, NS, CNAME, PTR, DNAME, MX,
+SRV and SOA values are decoded into strings/tuples; anything else stays raw rdata.
+Decoded names are canonical (lowercase, no trailing dot) and interned.
+"""
+
+import socket, struct, time, random, sys
+
+BUFFER_SIZE = 512
+EDNS_SIZE = 4096  # UDP payload we advertise (and read) when asking for DNSSEC records
+
+# Record types with structured rdata; anything else is passed through as raw bytes
+T_A, T_NS, T_CNAME, T_SOA, T_PTR, T_MX, T_AAAA, T_SRV, T_DNAME = 1, 2, 5, 6, 12, 15, 28, 33, 39
+T_OPT, T_DS, T_RRSIG, T_NSEC, T_DNSKEY, T_NSEC3 = 41, 43, 46, 47, 48, 50  # DNSSEC/EDNS, kept as raw rdata
+RCODE_OK, RCODE_SERVFAIL, RCODE_NXDOMAIN = 0, 2, 3
+MAX_CHAIN = 8  # CNAME/DNAME links followed per query
+
+# ---------------- Names ----------------
+def canonical(name):
+    """Case-insensitive form of a name: lowercase, no trailing dot, interned so
+    every record and cache entry naming it shares one string."""
+    return sys.intern(name.rstrip(".").lower())
+
+def name_key(name):
+    """Compact cache key for a name: its canonical wire format."""
+    return encode_domain(canonical(name))
+
+def rr_key(name, qtype):
+    return name_key(name) + struct.pack("!H", qtype)
+
+def randomize_case(name):
+    """0x20 encoding: random letter case that the server must echo back,
+    adding up to one bit of entropy per letter to the query ID."""
+    bits = random.getrandbits(len(name))
+    return "".join(c.upper() if bits >> i & 1 else c.lower() for i, c in enumerate(name))
+
+def encode_domain(name):
+    parts = [p for p in name.strip(".").split(".") if p]
+    return b"".join(bytes([len(p)]) + p.encode() for p in parts) + b"\x00"
+
+def decode_domain(data, offset):
+    labels = []
+    while True:
+        length = data[offset]
+        if length == 0:
+            offset += 1
+            break
+        if (length & 0xC0) == 0xC0:
+            ptr = struct.unpack_from("!H", data, offset)[0] & 0x3FFF
+            sub, _ = decode_domain(data, ptr)
+            labels.append(sub)
+            offset += 2
+            break
+        labels.append(data[offset+1:offset+1+length].decode())
+        offset += 1 + length
+    return canonical(".".join(labels)), offset
+
+def parse_question(data, offset):
+    qname, offset = decode_domain(data, offset)
+    qtype, qclass = struct.unpack_from("!HH", data, offset)
+    return qname, qtype, qclass, offset + 4
+
+def build_query(domain, qtype=1, qclass=1, dnssec=False):
+    """With `dnssec`, an EDNS OPT record sets the DO bit to ask for RRSIGs."""
+    tid = random.randint(0, 0xFFFF)
+    header = struct.pack("!HHHHHH", tid, 0x0100, 1, 0, 0, 1 if dnssec else 0)
+    question = encode_domain(domain) + struct.pack("!HH", qtype, qclass)
+    opt = b"\x00" + struct.pack("!HHIH", T_OPT, EDNS_SIZE, 0x8000, 0) if dnssec else b""
+    return header + question + opt
+
+def matches_query(query, resp, ignore_case=False):
+    """True if `resp` carries the ID and, byte for byte (so including the 0x20
+    letter case), the question of `query`. Anything else is stray or spoofed.
+    With ignore_case, the name may differ in letter case only."""
+    q_end = parse_question(query, 12)[3]
+    if len(resp) < q_end or resp[:2] != query[:2] or not resp[2] & 0x80:
+        return False
+    if ignore_case:  # label lengths are < 0x40, so lower() only touches letters
+        return (resp[12:q_end - 4].lower() == query[12:q_end - 4].lower()
+                and resp[q_end - 4:q_end] == query[q_end - 4:q_end])
+    return resp[12:q_end] == query[12:q_end]
+
+def send_query(server_ip, data, timeout=3, port=53):
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.settimeout(timeout)
+    start = time.time()
+    try:
+        s.sendto(data, (server_ip, port))
+        resp, _ = s.recvfrom(EDNS_SIZE)
+        rtt = (time.time() - start) * 1000
+        return resp, rtt
+    except Exception:
+        return None, None
+    finally:
+        s.close()
+
+def send_tcp_query(server_ip, data, timeout=3, port=53):
+    """send_query over TCP, for answers that came back truncated over UDP."""
+    start = time.time()
+    try:
+        with socket.create_connection((server_ip, port), timeout=timeout) as s:
+            s.sendall(struct.pack("!H", len(data)) + data)
+            resp = recv_exact(s, struct.unpack("!H", recv_exact(s, 2))[0])
+        return resp, (time.time() - start) * 1000
+    except (OSError, ValueError, struct.error):
+        return None, None
+
+def recv_exact(sock, n):
+    buf = b""
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ValueError("connection closed")
+        buf += chunk
+    return buf
+
+def decode_rdata(data, offset, rtype, rdlen):
+    rdata = data[offset:offset+rdlen]
+    if rtype == T_A and rdlen == 4:
+        return ".".join(map(str, rdata))
+    if rtype == T_AAAA and rdlen == 16:
+        return socket.inet_ntop(socket.AF_INET6, rdata)
+    if rtype in (T_NS, T_CNAME, T_PTR, T_DNAME):
+        return decode_domain(data, offset)[0]
+    if rtype == T_MX:
+        return struct.unpack_from("!H", data, offset)[0], decode_domain(data, offset + 2)[0]
+    if rtype == T_SRV:
+        return struct.unpack_from("!HHH", data, offset) + (decode_domain(data, offset + 6)[0],)
+    if rtype == T_SOA:
+        mname, off = decode_domain(data, offset)
+        rname, off = decode_domain(data, off)
+        return (mname, rname) + struct.unpack_from("!IIIII", data, off)
+    return rdata
+
+def encode_rdata(rtype, val):
+    if rtype == T_A:
+        return socket.inet_aton(val)
+    if rtype == T_AAAA:
+        return socket.inet_pton(socket.AF_INET6, val)
+    if rtype in (T_NS, T_CNAME, T_PTR, T_DNAME):
+        return encode_domain(val)
+    if rtype == T_MX:
+        return struct.pack("!H", val[0]) + encode_domain(val[1])
+    if rtype == T_SRV:
+        return struct.pack("!HHH", *val[:3]) + encode_domain(val[3])
+    if rtype == T_SOA:
+        return encode_domain(val[0]) + encode_domain(val[1]) + struct.pack("!IIIII", *val[2:])
+    return val
+
+def rdata_text(val):
+    """Presentation format of a decoded value (RFC 3597 \\# form for raw rdata)."""
+    if isinstance(val, bytes):
+        return f"\\# {len(val)} {val.hex()}".rstrip()
+    if isinstance(val, tuple):
+        return " ".join(map(str, val))
+    return val
+
+def response_status(data):
+    """(rcode, authoritative) of a response, or (None, False) if there is none."""
+    if not data or len(data) < 12:
+        return None, False
+    return data[3] & 0x0F, bool(data[2] & 0x04)
+
+def truncated(data):
+    """True if the TC bit says the sender could not fit the whole answer."""
+    return bool(data) and len(data) >= 12 and bool(data[2] & 0x02)
+
+def parse_response(data):
+    if not data or len(data) < 12:
+        return [], [], []
+    _, _, qd, an, ns, ar = struct.unpack_from("!HHHHHH", data, 0)
+    offset = 12
+    for _ in range(qd):
+        _, _, _, offset = parse_question(data, offset)
+    answers, auth, add = [], [], []
+    for section, count in zip(["ans", "auth", "add"], [an, ns, ar]):
+        for _ in range(count):
+            name, offset = decode_domain(data, offset)
+            rtype, rclass, ttl, rdlen = struct.unpack_from("!HHIH", data, offset)
+            offset += 10
+            val = decode_rdata(data, offset, rtype, rdlen)
+            offset += rdlen
+            if section == "ans": answers.append((name, rtype, val))
+            elif section == "auth": auth.append((name, rtype, val))
+            else: add.append((name, rtype, val))
+    return answers, auth, add
+
+def edns_size(data, q_end):
+    """UDP payload size advertised by a query's EDNS OPT record, None without one."""
+    if struct.unpack_from("!H", data, 10)[0] and data[q_end:q_end+3] == b"\x00\x00\x29":
+        return struct.unpack_from("!H", data, q_end + 3)[0]
+    return None
+
+def encode_name(name, names, offset):
+    """encode_domain with compression: `names` maps suffixes already in the
+    message to their offsets, and learns the new ones written at `offset`."""
+    labels, out = name.split(".") if name else [], b""
+    for i, label in enumerate(labels):
+        suffix = ".".join(labels[i:])
+        if suffix in names:
+            return out + struct.pack("!H", 0xC000 | names[suffix])
+        if offset + len(out) < 0x4000:
+            names[suffix] = offset + len(out)
+        out += bytes([len(label)]) + label.encode()
+    return out + b"\x00"
+
+def build_reply(query, q_end, records, rcode, tcp=False):
+    """Answer `query` with `records`, owner names compressed. Over UDP, records
+    that do not fit the client's size (512 bytes or its EDNS size) are left out
+    and TC is set, so the client can retry over TCP."""
+    size = edns_size(query, q_end)
+    limit = 0xFFFF if tcp else min(max(size, BUFFER_SIZE), EDNS_SIZE) if size else BUFFER_SIZE
+    opt = b"\x00" + struct.pack("!HHIH", T_OPT, EDNS_SIZE, 0, 0) if size else b""
+    names, body, count, flags = {}, b"", 0, 0x8180 | rcode
+    encode_name(parse_question(query, 12)[0], names, 12)  # owners can point into the question
+    for name, rtype, value in records:
+        rdata = encode_rdata(rtype, value)
+        rr = encode_name(name, names, q_end + len(body)) + struct.pack("!HHIH", rtype, 1, 60, len(rdata)) + rdata
+        if q_end + len(body) + len(rr) + len(opt) > limit:
+            flags |= 0x0200
+            break
+        body, count = body + rr, count + 1
+    header = query[:2] + struct.pack("!HHHHH", flags, 1, count, 0, 1 if opt else 0)
+    return header + query[12:q_end] + body + opt
+
+# ---------------- CNAME / DNAME chains ----------------
+def follow_chain(ans, name, qtype):
+    """Walk alias links for `name` within one answer section.
+    Returns (links, final_name, records): the CNAME links traversed (DNAMEs
+    are turned into the CNAME they synthesize) and the qtype RRset at the end."""
+    links = []
+    for _ in range(MAX_CHAIN):
+        records = [r for r in ans if r[0].lower() == name.lower() and r[1] == qtype]
+        if records:
+            return links, name, records
+        link = next((r for r in ans if r[0].lower() == name.lower() and r[1] == T_CNAME), None)
+        if link is None:
+            dname = next((r for r in ans if r[1] == T_DNAME
+                          and name.lower().endswith("." + r[0].lower())), None)
+            if dname is None:
+                break
+            link = (name, T_CNAME, name[:-len(dname[0])] + dname[2])
+        links.append(link)
+        name = link[2]
+    return links, name, []
+
+def first_value(records, rtype):
+    return next((r[2] for r in records if r[1] == rtype), None)
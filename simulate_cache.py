@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+simulate_cache.py
+-----------------
+Offline "what if" for the resolver cache: replays recorded queries through
+pluggable cache policies and predicts hit ratio, upstream queries and latency
+without a live rerun.
+
+Inputs:
+  --summary  resolver summary logs (timestamp, client, domain, result_ip, ...)
+  --steps    matching step logs; each domain's recorded resolution path
+             (servers contacted, referrals, timeouts) is what a miss costs
+  --pcap     captures, via replay_pcap.extract_queries, for traces with
+             original timing
+
+Latency model: a miss costs the mean recorded RTT of every server on the
+domain's path (timeouts cost the resolver's query_timeout). Domains with no
+recorded path get a root → TLD → authoritative path at the mean RTT of each
+level. With delegation caching, a cached TLD delegation skips the root steps
+and a cached zone delegation (approximated as the last two labels) also
+skips the TLD steps. Queries that failed or came back empty (NODATA) in the
+log are never cached, as in the resolver.
+
+Usage:
+    python3 simulate_cache.py --summary results_custom_cache/H*_summary.csv \\
+        --steps results_custom_cache/H*_steps.csv --policies lru lfu arc ttl --sizes 50 500 0
+"""
+
+import csv, time, argparse
+from collections import OrderedDict
+from functools import lru_cache
+
+from resolver.config import Config
+from resolver.wire import canonical
+
+DEFAULT_LEVEL_RTT = (150.0, 150.0, 50.0)  # root / TLD / auth ms, roughly the H1 run
+HIT_LATENCY = 0.0                         # ms; cache hits log as 0.00
+
+# ---------------- Policies ----------------
+# Each policy tracks keys only: get() says whether a key is cached (and
+# updates recency/frequency), put() inserts and returns the key it evicted
+# (or None), discard() drops an expired key. capacity 0 means unbounded.
+
+class LRU:
+    def __init__(self, capacity):
+        self.capacity, self.keys = capacity, OrderedDict()
+
+    def get(self, key):
+        if key in self.keys:
+            self.keys.move_to_end(key)
+            return True
+        return False
+
+    def put(self, key):
+        self.keys[key] = None
+        self.keys.move_to_end(key)
+        if self.capacity and len(self.keys) > self.capacity:
+            return self.keys.popitem(last=False)[0]
+
+    def discard(self, key):
+        self.keys.pop(key, None)
+
+class TTLOnly(LRU):
+    """The live resolver's policy: unbounded, entries only leave by expiring."""
+
+    def __init__(self, capacity):
+        super().__init__(0)
+
+class LFU:
+    """O(1) LFU: per-frequency buckets in insertion order, evict from the lowest."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.freq = {}
+        self.buckets = {}  # frequency → OrderedDict of keys
+        self.min_freq = 0
+
+    def touch(self, key):
+        f = self.freq[key]
+        bucket = self.buckets[f]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[f]
+            if self.min_freq == f:
+                self.min_freq = f + 1
+        self.freq[key] = f + 1
+        self.buckets.setdefault(f + 1, OrderedDict())[key] = None
+
+    def get(self, key):
+        if key in self.freq:
+            self.touch(key)
+            return True
+        return False
+
+    def put(self, key):
+        if key in self.freq:
+            self.touch(key)
+            return None
+        victim = None
+        if self.capacity and len(self.freq) >= self.capacity:
+            victim, _ = self.buckets[self.min_freq].popitem(last=False)
+            if not self.buckets[self.min_freq]:
+                del self.buckets[self.min_freq]
+            del self.freq[victim]
+        self.freq[key] = 1
+        self.buckets.setdefault(1, OrderedDict())[key] = None
+        self.min_freq = 1
+        return victim
+
+    def discard(self, key):
+        f = self.freq.pop(key, None)
+        if f is None:
+            return
+        bucket = self.buckets[f]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[f]
+            if self.min_freq == f:
+                self.min_freq = min(self.buckets, default=0)
+
+class ARC:
+    """Adaptive Replacement Cache (Megiddo & Modha): recency list T1 and
+    frequency list T2, with ghost lists B1/B2 steering the target size p.
+    Expired entries leave T1/T2 early, so replacement only runs while T1+T2
+    is actually full."""
+
+    def __init__(self, capacity):
+        self.c = capacity or float("inf")
+        self.p = 0
+        self.t1, self.t2, self.b1, self.b2 = OrderedDict(), OrderedDict(), OrderedDict(), OrderedDict()
+
+    def get(self, key):
+        if key in self.t1:
+            del self.t1[key]
+            self.t2[key] = None
+            return True
+        if key in self.t2:
+            self.t2.move_to_end(key)
+            return True
+        return False
+
+    def replace(self, key):
+        if len(self.t1) + len(self.t2) < self.c:
+            return None
+        if self.t1 and (len(self.t1) > self.p or (key in self.b2 and len(self.t1) == self.p)):
+            old, _ = self.t1.popitem(last=False)
+            self.b1[old] = None
+        elif self.t2:
+            old, _ = self.t2.popitem(last=False)
+            self.b2[old] = None
+        else:
+            old, _ = self.t1.popitem(last=False)
+            self.b1[old] = None
+        return old
+
+    def put(self, key):
+        if key in self.t1 or key in self.t2:
+            self.get(key)
+            return None
+        c = self.c
+        if key in self.b1:
+            self.p = min(c, self.p + max(len(self.b2) / len(self.b1), 1))
+            victim = self.replace(key)
+            del self.b1[key]
+            self.t2[key] = None
+            return victim
+        if key in self.b2:
+            self.p = max(0, self.p - max(len(self.b1) / len(self.b2), 1))
+            victim = self.replace(key)
+            del self.b2[key]
+            self.t2[key] = None
+            return victim
+        victim = None
+        l1 = len(self.t1) + len(self.b1)
+        if l1 >= c:
+            if len(self.t1) < c:
+                self.b1.popitem(last=False)
+                victim = self.replace(key)
+            else:
+                victim, _ = self.t1.popitem(last=False)
+        elif l1 + len(self.t2) + len(self.b2) >= c:
+            if l1 + len(self.t2) + len(self.b2) >= 2 * c:
+                self.b2.popitem(last=False)
+            victim = self.replace(key)
+        self.t1[key] = None
+        return victim
+
+    def discard(self, key):
+        for lst in (self.t1, self.t2):
+            lst.pop(key, None)
+
+POLICIES = {"lru": LRU, "lfu": LFU, "arc": ARC, "ttl": TTLOnly}
+
+class Expiring:
+    """Wraps a policy so entries also expire `ttl` seconds after insertion.
+    `born` holds exactly the cached keys, so a miss never reaches the policy."""
+
+    def __init__(self, policy, ttl):
+        self.policy, self.ttl, self.born = policy, ttl, {}
+
+    def get(self, key, now):
+        born = self.born.get(key)
+        if born is None:
+            return False
+        if self.ttl and now - born > self.ttl:
+            self.policy.discard(key)
+            del self.born[key]
+            return False
+        return self.policy.get(key)
+
+    def put(self, key, now):
+        victim = self.policy.put(key)
+        if victim is not None:
+            del self.born[victim]
+        self.born[key] = now
+
+# ---------------- Trace loading ----------------
+@lru_cache(maxsize=None)
+def parse_ts(value):
+    """Log timestamps have 1 s resolution, so each distinct string is parsed once."""
+    return time.mktime(time.strptime(value, "%Y-%m-%d %H:%M:%S"))
+
+def load_summaries(paths):
+    """Events (time, domain, qtype, uncached) from summary logs; the resolver
+    caches neither failures nor empty answers."""
+    events, names = [], {}
+    for path in paths:
+        with open(path, newline="") as f:
+            rows = csv.reader(f)
+            header = next(rows, [])
+            ts_col, domain_col, ip_col = (header.index(c) for c in ("timestamp", "domain", "result_ip"))
+            qtype_col = header.index("qtype") if "qtype" in header else None
+            for row in rows:
+                raw = row[domain_col]
+                domain = names.get(raw)
+                if domain is None:
+                    domain = names[raw] = canonical(raw.strip())
+                qtype = row[qtype_col] if qtype_col is not None else ""
+                events.append((parse_ts(row[ts_col]), domain, int(qtype) if qtype else 1,
+                               row[ip_col] in ("FAIL", "NODATA")))
+    return events
+
+def load_pcaps(paths):
+    from replay_pcap import extract_queries
+    return [(ts, qname, qtype, False) for path in paths for ts, _, qname, qtype in extract_queries(path)]
+
+def load_paths(paths):
+    """Recorded resolution path per domain plus per-server mean RTTs.
+
+    A path is the list of (server, step, response_type, rtt or None) of one
+    uncached resolution; the first one that ended in an answer is kept."""
+    paths_by_domain, samples = {}, {}
+    for path in paths:
+        with open(path, newline="") as f:
+            current, key = [], None
+            for row in csv.DictReader(f):
+                if row["cache_status"] == "HIT" or row["resolution_mode"] == "cached":
+                    continue
+                rtt = None if row["rtt_ms"] == "timeout" else float(row["rtt_ms"])
+                if rtt is not None:
+                    samples.setdefault(row["dns_server_ip"], []).append(rtt)
+                row_key = (row["timestamp"], canonical(row["domain"].strip()))
+                if row_key != key:
+                    keep_path(paths_by_domain, key, current)
+                    current, key = [], row_key
+                current.append((row["dns_server_ip"], row["step"], row["response_type"], rtt,
+                                row["total_time_ms"] != "-"))
+            keep_path(paths_by_domain, key, current)
+    server_rtt = {srv: sum(v) / len(v) for srv, v in samples.items()}
+    return paths_by_domain, server_rtt
+
+def keep_path(paths_by_domain, key, steps):
+    if not key or not steps:
+        return
+    answered = steps[-1][4]
+    known = paths_by_domain.get(key[1])
+    if known is None or (answered and not known[1]):
+        paths_by_domain[key[1]] = ([s[:4] for s in steps], answered)
+
+def level_rtts(paths_by_domain, server_rtt):
+    """Mean RTT of root, TLD and authoritative steps over all recorded paths."""
+    sums = [[0.0, 0], [0.0, 0], [0.0, 0]]
+    for steps, _ in paths_by_domain.values():
+        root_end, tld_end = segments(steps)
+        for i, (srv, _, _, rtt) in enumerate(steps):
+            if rtt is None:
+                continue
+            level = 0 if i < root_end else 1 if i < tld_end else 2
+            sums[level][0] += server_rtt.get(srv, rtt)
+            sums[level][1] += 1
+    return tuple(s / n if n else d for (s, n), d in zip(sums, DEFAULT_LEVEL_RTT))
+
+def segments(steps):
+    """Indexes where the root steps end and where the TLD referral ends."""
+    root_end = next((i for i, s in enumerate(steps) if s[1] != "ROOT"), len(steps))
+    tld_end = next((i + 1 for i in range(root_end, len(steps)) if steps[i][2] == "REFERRAL"), root_end)
+    return root_end, tld_end
+
+def path_costs(steps, server_rtt, timeout_ms):
+    """(latency, queries) of a full miss, after a cached TLD delegation, and
+    after a cached zone delegation."""
+    costs = [timeout_ms if rtt is None else server_rtt.get(srv, rtt) for srv, _, _, rtt in steps]
+    root_end, tld_end = segments(steps)
+    return ((sum(costs), len(costs)),
+            (sum(costs[root_end:]), len(costs) - root_end),
+            (sum(costs[tld_end:]), len(costs) - tld_end))
+
+# ---------------- Simulation ----------------
+def prepare(events, costs, default_cost):
+    """Work out each event's keys and miss costs once for all policy runs:
+    (time, answer key, zone, tld, (full, after_root, after_tld), uncached).
+    Answer keys are small ints, which hash faster than (domain, qtype)."""
+    keys, domains, prepared = {}, {}, []
+    for now, domain, qtype, uncached in events:
+        key = keys.setdefault((domain, qtype), len(keys))
+        info = domains.get(domain)
+        if info is None:
+            labels = domain.rsplit(".", 2)
+            info = domains[domain] = (".".join(labels[-2:]), labels[-1], costs.get(domain, default_cost))
+        zone, tld, cost = info
+        prepared.append((now, key, zone, tld, cost, uncached))
+    return prepared
+
+def simulate(events, policy, capacity, ttl, delegation):
+    """Run prepare()d events through one policy configuration."""
+    answers = Expiring(POLICIES[policy](capacity), ttl)
+    delegations = Expiring(POLICIES[policy](capacity), ttl)
+    hits = upstream = 0
+    latency = 0.0
+    for now, key, zone, tld, (full, after_root, after_tld), uncached in events:
+        if answers.get(key, now):
+            hits += 1
+            latency += HIT_LATENCY
+            continue
+        if delegation:
+            if delegations.get(zone, now):
+                cost = after_tld
+            elif delegations.get(tld, now):
+                cost = after_root
+            else:
+                cost = full
+            delegations.put(tld, now)
+            if after_tld != after_root:
+                delegations.put(zone, now)
+        else:
+            cost = full
+        latency += cost[0]
+        upstream += cost[1]
+        if not uncached:
+            answers.put(key, now)
+    n = len(events)
+    return {"hit_ratio": 100 * hits / n if n else 0, "upstream_queries": upstream,
+            "avg_latency_ms": latency / n if n else 0}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Predict cache behaviour from recorded resolver logs")
+    ap.add_argument("--summary", nargs="*", default=[])
+    ap.add_argument("--steps", nargs="*", default=[])
+    ap.add_argument("--pcap", nargs="*", default=[])
+    ap.add_argument("--policies", nargs="*", default=list(POLICIES), choices=list(POLICIES))
+    ap.add_argument("--sizes", nargs="*", type=int, default=[0], help="capacities in entries; 0 = unbounded")
+    ap.add_argument("--ttl", type=float, default=Config().cache_ttl, help="seconds; 0 = never expire")
+    ap.add_argument("--out", help="also write the results table to this CSV")
+    args = ap.parse_args()
+
+    start = time.time()
+    events = load_summaries(args.summary) + load_pcaps(args.pcap)
+    events.sort(key=lambda e: e[0])
+    paths_by_domain, server_rtt = load_paths(args.steps)
+    timeout_ms = Config().query_timeout * 1000
+    costs = {d: path_costs(steps, server_rtt, timeout_ms) for d, (steps, _) in paths_by_domain.items()}
+    root, tld, auth = level_rtts(paths_by_domain, server_rtt)
+    default_cost = ((root + tld + auth, 3), (tld + auth, 2), (auth, 1))
+    events = prepare(events, costs, default_cost)
+    print(f"[+] {len(events)} queries, {len(costs)} recorded paths, {len(server_rtt)} servers "
+          f"(loaded in {time.time() - start:.2f} s)")
+
+    header = ["policy", "capacity", "delegation_cache", "queries", "hit_ratio_pct", "upstream_queries", "avg_latency_ms"]
+    rows = []
+    for policy in args.policies:
+        for size in args.sizes:
+            for delegation in (False, True):
+                r = simulate(events, policy, size, args.ttl, delegation)
+                rows.append([policy, size or "inf", "yes" if delegation else "no", len(events),
+                             f"{r['hit_ratio']:.2f}", r["upstream_queries"], f"{r['avg_latency_ms']:.2f}"])
+
+    widths = [max(len(str(x)) for x in col) for col in zip(header, *rows)]
+    for row in [header] + rows:
+        print("  ".join(str(x).rjust(w) for x, w in zip(row, widths)))
+    if args.out:
+        with open(args.out, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(header)
+            w.writerows(rows)
+        print(f"[✓] Results saved to {args.out}")
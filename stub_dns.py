@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+stub_dns.py
+-----------
+Small authoritative DNS server for testing the resolvers without Internet
+access. It answers from a zone file over UDP (setting TC when an answer does
+not fit) and TCP (and TLS if given a certificate), so one instance can stand
+in for an upstream forwarder, and a few instances on different loopback
+addresses form a local root → TLD → authoritative hierarchy.
+
+Zone file: one record per line, `;` starts a comment.
+    .                 300 SOA a.root.test. admin.test. 1 7200 900 1209600 300
+    com.              300 NS  a.gtld.test.
+    a.gtld.test.      300 A   127.0.0.11
+    www.example.com.  300 A   93.184.216.34
+    mail.example.com. 300 MX  10 mx.example.com.
+
+Names with an SOA are zone apexes; NS records anywhere else are delegations
+and are answered with a referral (plus glue found in the file).
+
+With --keys DIR the zones are DNSSEC-signed at startup: one key per apex,
+kept in DIR/<zone>.key (created on first use), a DNSKEY at each apex, a DS
+at each delegation whose child key is in DIR, an NSEC chain per zone, and
+RRSIGs and NSEC denials sent to queries with the DO bit. A DS is only published for a child whose key already
+exists, so start the stubs from the leaves up and pass the trust anchor the
+root prints to the resolver's --trust-anchors.
+
+Usage:
+    python3 stub_dns.py zone.txt 127.0.0.10 [--port 53] [--tls cert.pem key.pem] [--delay MS]
+                        [--keys DIR [--algorithm 8|13]]
+"""
+
+import os, json, socket, ssl, struct, time, threading, argparse, hashlib, secrets
+
+from resolver.wire import (encode_domain, decode_domain, encode_rdata, parse_question, edns_size, MAX_CHAIN,
+                           BUFFER_SIZE, T_A, T_NS, T_CNAME, T_SOA, T_MX, T_AAAA, T_SRV, T_DNAME, T_PTR,
+                           T_OPT, T_DS, T_RRSIG, T_NSEC, T_DNSKEY, RCODE_OK, RCODE_NXDOMAIN)
+from resolver.dnssec import (ALG_RSASHA256, ALG_ECDSAP256, SHA256_DIGEST_INFO, P256_N, P256_G,
+                             ec_mul, key_tag, make_ds, make_type_bitmap, signed_data, canonical_order, covers)
+
+TYPES = {"A": T_A, "NS": T_NS, "CNAME": T_CNAME, "SOA": T_SOA, "PTR": T_PTR, "MX": T_MX,
+         "AAAA": T_AAAA, "SRV": T_SRV, "DNAME": T_DNAME, "TXT": 16}
+
+def canon(name):
+    return name.strip().rstrip(".").lower()
+
+# ---------------- Zone data ----------------
+def load_zone(path):
+    """name → list of (rtype, ttl, value)"""
+    zone = {}
+    with open(path) as f:
+        for line in f:
+            fields = line.split(";", 1)[0].split()
+            if not fields:
+                continue
+            name, ttl, rtype, rdata = canon(fields[0]), int(fields[1]), TYPES[fields[2].upper()], fields[3:]
+            if rtype in (T_A, T_AAAA):
+                val = rdata[0]
+            elif rtype in (T_NS, T_CNAME, T_PTR, T_DNAME):
+                val = canon(rdata[0])
+            elif rtype == T_MX:
+                val = (int(rdata[0]), canon(rdata[1]))
+            elif rtype == T_SRV:
+                val = tuple(map(int, rdata[:3])) + (canon(rdata[3]),)
+            elif rtype == T_SOA:
+                val = (canon(rdata[0]), canon(rdata[1])) + tuple(map(int, rdata[2:7]))
+            else:  # TXT
+                text = " ".join(rdata).strip('"').encode()
+                val = bytes([len(text)]) + text
+            zone.setdefault(name, []).append((rtype, ttl, val))
+    return zone
+
+def suffixes(name):
+    labels = name.split(".") if name else []
+    return [".".join(labels[i:]) for i in range(len(labels))] + [""]
+
+def apex(zone, name):
+    return next((s for s in suffixes(name) if any(r[0] == T_SOA for r in zone.get(s, []))), "")
+
+def delegation(zone, name, qtype):
+    """Closest non-apex name at or above `name` carrying NS records. DS lives
+    on the parent side of a cut, so a DS query does not stop at its own name."""
+    for s in suffixes(name):
+        if s == name and qtype == T_DS:
+            continue
+        rrs = zone.get(s, [])
+        if any(r[0] == T_SOA for r in rrs):
+            return None
+        if any(r[0] == T_NS for r in rrs):
+            return s
+    return None
+
+def rrs_of(zone, name, rtype):
+    return [(name, t, ttl, v) for t, ttl, v in zone.get(name, []) if t == rtype]
+
+def exists(zone, name):
+    """Owns records, or is an empty non-terminal above names that do."""
+    return name in zone or any(n.endswith("." + name) or not name for n in zone)
+
+def nsec_proof(zone, name, nxdomain):
+    """NSEC records denying `name` (nxdomain) or its missing types; none if unsigned."""
+    if name in zone:
+        return rrs_of(zone, name, T_NSEC)
+    signer = apex(zone, name)
+    chain = [rr for n in zone if apex(zone, n) == signer for rr in rrs_of(zone, n, T_NSEC)]
+    wanted = [name]
+    if nxdomain:  # also show there is no wildcard at the closest encloser
+        ce = next(s for s in suffixes(name)[1:] if exists(zone, s))
+        wanted.append("*." + ce if ce else "*")
+    proof = [rr for rr in chain for n in wanted
+             if covers(canonical_order(rr[0]), canonical_order(decode_domain(rr[3], 0)[0]), canonical_order(n))]
+    return list(dict.fromkeys(proof))
+
+def answer(zone, qname, qtype):
+    """(authoritative, rcode, answer, authority, additional) for one question."""
+    name, ans = canon(qname), []
+    for _ in range(MAX_CHAIN):
+        cut = delegation(zone, name, qtype)
+        if cut is not None:
+            ns = rrs_of(zone, cut, T_NS)
+            glue = [rr for r in ns for rr in rrs_of(zone, r[3], T_A)]
+            return False, RCODE_OK, ans, ns, glue
+        soa = rrs_of(zone, apex(zone, name), T_SOA)
+        if not exists(zone, name):
+            dname = next((rr for s in suffixes(name)[1:] for rr in rrs_of(zone, s, T_DNAME)), None)
+            if dname is None:
+                return True, RCODE_NXDOMAIN if not ans else RCODE_OK, ans, soa + nsec_proof(zone, name, True), []
+            target = name[:-len(dname[0])] + dname[3] if dname[0] else name + "." + dname[3]
+            ans += [dname, (name, T_CNAME, dname[2], target)]
+            name = target
+            continue
+        match = rrs_of(zone, name, qtype)
+        if match:
+            return True, RCODE_OK, ans + match, [], []
+        cname = rrs_of(zone, name, T_CNAME)
+        if not cname:
+            return True, RCODE_OK, ans, soa + nsec_proof(zone, name, False), []
+        ans += cname
+        name = cname[0][3]
+    return True, RCODE_OK, ans, [], []
+
+def encode_rr(name, rtype, ttl, val):
+    rdata = encode_rdata(rtype, val)
+    return encode_domain(name) + struct.pack("!HHIH", rtype, 1, ttl, len(rdata)) + rdata
+
+def with_sigs(zone, rrs):
+    """`rrs` followed by the RRSIGs over each of its RRsets."""
+    sigs = []
+    for name, rtype in dict.fromkeys((rr[0], rr[1]) for rr in rrs):
+        sigs += [(name, T_RRSIG, ttl, v) for t, ttl, v in zone.get(name, [])
+                 if t == T_RRSIG and struct.unpack_from("!H", v)[0] == rtype]
+    return rrs + sigs
+
+def respond(zone, data):
+    qname, qtype, _, q_end = parse_question(data, 12)
+    aa, rcode, ans, auth, add = answer(zone, qname, qtype)
+    edns = struct.unpack_from("!H", data, 10)[0] > 0 and data[q_end:q_end+3] == b"\x00\x00\x29"
+    do = edns and struct.unpack_from("!I", data, q_end + 5)[0] & 0x8000
+    if do:
+        ans, auth = with_sigs(zone, ans), with_sigs(zone, auth) if aa else auth
+    else:
+        auth = [rr for rr in auth if rr[1] != T_NSEC]
+    opt = b"\x00" + struct.pack("!HHIH", T_OPT, 4096, do, 0) if edns else b""
+    flags = 0x8000 | (data[2] & 0x01) << 8 | 0x0080 | (0x0400 if aa else 0) | rcode
+    header = data[:2] + struct.pack("!HHHHH", flags, 1, len(ans), len(auth), len(add) + bool(opt))
+    return header + data[12:q_end] + b"".join(encode_rr(*rr) for rr in ans + auth + add) + opt
+
+# ---------------- DNSSEC signing ----------------
+def is_probable_prime(n, rounds=32):
+    if n < 2:
+        return False
+    for p in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37):
+        if n % p == 0:
+            return n == p
+    d, r = n - 1, 0
+    while d % 2 == 0:
+        d, r = d // 2, r + 1
+    for _ in range(rounds):
+        x = pow(secrets.randbelow(n - 3) + 2, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(r - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+def random_prime(bits):
+    while True:
+        p = secrets.randbits(bits) | (3 << bits - 2) | 1  # top two bits set: p*q has 2*bits bits
+        if is_probable_prime(p):
+            return p
+
+def generate_key(alg, bits=2048):
+    if alg == ALG_ECDSAP256:
+        return {"alg": alg, "d": secrets.randbelow(P256_N - 1) + 1}
+    e = 65537
+    while True:
+        p, q = random_prime(bits // 2), random_prime(bits // 2)
+        phi = (p - 1) * (q - 1)
+        if p != q and phi % e:
+            return {"alg": alg, "n": p * q, "e": e, "d": pow(e, -1, phi)}
+
+def load_key(keydir, zone, alg):
+    """The zone's private key from DIR/<zone>.key, generated on first use."""
+    path = os.path.join(keydir, (zone or "root") + ".key")
+    if not os.path.exists(path):
+        tmp = f"{path}.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(generate_key(alg), f)
+        try:
+            os.link(tmp, path)  # atomic: another stub may have created it meanwhile
+        except FileExistsError:
+            pass
+        os.remove(tmp)
+    with open(path) as f:
+        return json.load(f)
+
+def dnskey_rdata(key):
+    """Flags 257: a zone key that is also the KSK (one key signs everything)."""
+    if key["alg"] == ALG_ECDSAP256:
+        x, y = ec_mul(key["d"], P256_G)
+        public = x.to_bytes(32, "big") + y.to_bytes(32, "big")
+    else:
+        public = b"\x03" + key["e"].to_bytes(3, "big") + key["n"].to_bytes((key["n"].bit_length() + 7) // 8, "big")
+    return struct.pack("!HBB", 257, 3, key["alg"]) + public
+
+def sign(key, data):
+    digest = hashlib.sha256(data).digest()
+    if key["alg"] == ALG_ECDSAP256:
+        while True:
+            k = secrets.randbelow(P256_N - 1) + 1
+            r = ec_mul(k, P256_G)[0] % P256_N
+            s = pow(k, -1, P256_N) * (int.from_bytes(digest, "big") + r * key["d"]) % P256_N
+            if r and s:
+                return r.to_bytes(32, "big") + s.to_bytes(32, "big")
+    size = (key["n"].bit_length() + 7) // 8
+    tail = SHA256_DIGEST_INFO + digest
+    em = b"\x00\x01" + b"\xff" * (size - len(tail) - 3) + b"\x00" + tail
+    return pow(int.from_bytes(em, "big"), key["d"], key["n"]).to_bytes(size, "big")
+
+def sign_zone(zone, keydir, alg):
+    """Add DNSKEY, DS, NSEC and RRSIG records to `zone`; returns {apex: DNSKEY rdata}."""
+    apexes = [name for name, rrs in zone.items() if any(r[0] == T_SOA for r in rrs)]
+    keys = {name: load_key(keydir, name, alg) for name in apexes}
+    dnskeys = {name: dnskey_rdata(key) for name, key in keys.items()}
+    for name in apexes:
+        zone[name].append((T_DNSKEY, 300, dnskeys[name]))
+    for name, rrs in zone.items():
+        child = os.path.join(keydir, name + ".key")
+        if name not in keys and any(r[0] == T_NS for r in rrs) and os.path.exists(child):
+            rrs.append((T_DS, 300, make_ds(name, dnskey_rdata(load_key(keydir, name, alg)))))
+    for signer in apexes:
+        # Every name the zone is authoritative for, delegation points included
+        # (their NSEC is the parent's); glue below a cut is not
+        owners = sorted((n for n in zone if apex(zone, n) == signer and delegation(zone, n, T_DS) is None),
+                        key=canonical_order)
+        ttl = next(v[6] for t, _, v in zone[signer] if t == T_SOA)  # SOA minimum
+        for owner, nxt in zip(owners, owners[1:] + owners[:1]):
+            types = {r[0] for r in zone[owner]} | {T_NSEC, T_RRSIG}
+            zone[owner].append((T_NSEC, ttl, encode_domain(nxt) + make_type_bitmap(types)))
+
+    now = int(time.time())
+    for name in list(zone):
+        signer = apex(zone, name)
+        if signer not in keys:
+            continue
+        for rtype in dict.fromkeys(r[0] for r in zone[name]):
+            if delegation(zone, name, T_DS if rtype == T_NSEC else rtype) is not None:
+                continue  # referral NS and glue belong to the child zone (DS and NSEC to the parent)
+            rrset = [(name, t, v) for t, _, v in zone[name] if t == rtype]
+            ttl = next(ttl for t, ttl, _ in zone[name] if t == rtype)
+            labels = len(name.split(".")) if name else 0
+            head = struct.pack("!HBBIIIH", rtype, keys[signer]["alg"], labels, ttl, now + 30 * 86400, now - 3600,
+                               key_tag(dnskeys[signer])) + encode_domain(signer)
+            zone[name].append((T_RRSIG, ttl, head + sign(keys[signer], signed_data(head, rrset))))
+    return dnskeys
+
+# ---------------- Transports ----------------
+def serve_udp(zone, ip, port, delay):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((ip, port))
+    while True:
+        data, addr = sock.recvfrom(4096)
+        try:
+            reply = respond(zone, data)
+            q_end = parse_question(data, 12)[3]
+            if len(reply) > (edns_size(data, q_end) or BUFFER_SIZE):
+                # Too big for UDP: question only, TC set, so the client retries over TCP
+                flags = struct.unpack_from("!H", reply, 2)[0] | 0x0200
+                reply = reply[:2] + struct.pack("!HHHHH", flags, 1, 0, 0, 0) + data[12:q_end]
+        except Exception:
+            continue
+        time.sleep(delay)
+        sock.sendto(reply, addr)
+
+def serve_stream(zone, conn, delay):
+    """One TCP/TLS connection: answer length-prefixed queries as they arrive,
+    each in its own thread, so pipelined queries are answered concurrently."""
+    lock, threads = threading.Lock(), []
+    def send_reply(data):
+        try:
+            reply = respond(zone, data)
+            time.sleep(delay)
+            with lock:
+                conn.sendall(struct.pack("!H", len(reply)) + reply)
+        except Exception:
+            pass
+    try:
+        while True:
+            head = conn.recv(2)
+            if len(head) < 2:
+                break
+            length, data = struct.unpack("!H", head)[0], b""
+            while len(data) < length:
+                chunk = conn.recv(length - len(data))
+                if not chunk:
+                    return
+                data += chunk
+            threads.append(threading.Thread(target=send_reply, args=(data,), daemon=True))
+            threads[-1].start()
+    except (OSError, ValueError, struct.error):
+        pass
+    finally:
+        for t in threads:
+            t.join()
+        conn.close()
+
+def serve_tcp(zone, ip, port, delay, ctx=None):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((ip, port))
+    sock.listen(16)
+    while True:
+        conn, _ = sock.accept()
+        if ctx:
+            try:
+                conn = ctx.wrap_socket(conn, server_side=True)
+            except (OSError, ssl.SSLError):
+                conn.close()
+                continue
+        threading.Thread(target=serve_stream, args=(zone, conn, delay), daemon=True).start()
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Authoritative stub DNS server for local tests")
+    ap.add_argument("zone")
+    ap.add_argument("ip")
+    ap.add_argument("--port", type=int, default=53)
+    ap.add_argument("--tls", nargs=2, metavar=("CERT", "KEY"), help="also serve DNS-over-TLS")
+    ap.add_argument("--tls-port", type=int, default=853)
+    ap.add_argument("--delay", type=float, default=0, help="added latency per answer (ms)")
+    ap.add_argument("--keys", metavar="DIR", help="DNSSEC-sign the zones with keys kept in DIR")
+    ap.add_argument("--algorithm", type=int, choices=[ALG_RSASHA256, ALG_ECDSAP256], default=ALG_RSASHA256)
+    args = ap.parse_args()
+
+    zone, delay = load_zone(args.zone), args.delay / 1000
+    if args.keys:
+        os.makedirs(args.keys, exist_ok=True)
+        for name, dnskey in sign_zone(zone, args.keys, args.algorithm).items():
+            ds = make_ds(name, dnskey)
+            print(f"[+] Trust anchor: {name}. {key_tag(dnskey)} {ds[2]} {ds[3]} {ds[4:].hex().upper()}")
+    threading.Thread(target=serve_tcp, args=(zone, args.ip, args.port, delay), daemon=True).start()
+    if args.tls:
+        ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ctx.load_cert_chain(*args.tls)
+        threading.Thread(target=serve_tcp, args=(zone, args.ip, args.tls_port, delay, ctx), daemon=True).start()
+    print(f"[+] Stub DNS serving {args.zone} ({sum(map(len, zone.values()))} records) on {args.ip}:{args.port}")
+    serve_udp(zone, args.ip, args.port, delay)
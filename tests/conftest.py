@@ -0,0 +1,92 @@
+"""
+A local root → com → example.com/other.com hierarchy of stub_dns.py servers
+on loopback addresses, shared by the tests that resolve over the network.
+ROOT2 is a second root server; lame.com is delegated to a name that does not exist.
+"""
+
+import socket, threading, time
+
+import pytest
+
+import stub_dns
+from resolver.config import Config
+from resolver.engine import Engine
+from resolver.server import start_server
+
+ROOT, COM, EXAMPLE, OTHER, ROOT2 = "127.0.0.10", "127.0.0.11", "127.0.0.12", "127.0.0.13", "127.0.0.14"
+
+ZONES = {
+    ROOT: """.                 300 SOA a.root.test. admin.test. 1 7200 900 1209600 300
+             com.              300 NS  a.gtld.test.
+             a.gtld.test.      300 A   127.0.0.11""",
+    COM: """com.              300 SOA a.gtld.test. admin.test. 1 7200 900 1209600 300
+            example.com.      300 NS  ns.example.com.
+            ns.example.com.   300 A   127.0.0.12
+            other.com.        300 NS  ns.other.com.
+            ns.other.com.     300 A   127.0.0.13
+            lame.com.         300 NS  ns.nowhere.com.""",
+    EXAMPLE: """example.com.      300 SOA ns.example.com. admin.example.com. 1 7200 900 1209600 300
+                www.example.com.  300 A     93.184.216.34
+                www.example.com.  300 AAAA  2001:db8::34
+                mail.example.com. 300 MX    10 www.example.com.
+                txt.example.com.  300 TXT   "hello"
+                alias.example.com. 300 CNAME www.example.com.
+                out.example.com.  300 CNAME www.other.com.
+                loop1.example.com. 300 CNAME loop2.example.com.
+                loop2.example.com. 300 CNAME loop1.example.com.
+             """ + "\n".join(f"big.example.com. 300 A 10.0.0.{i}" for i in range(1, 41)),
+    OTHER: """other.com.        300 SOA ns.other.com. admin.other.com. 1 7200 900 1209600 300
+              www.other.com.    300 A   198.51.100.7""",
+}
+
+def free_port(ip=ROOT):
+    """A port that is currently free for both UDP and TCP on `ip`."""
+    while True:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as u, socket.socket() as t:
+            u.bind((ip, 0))
+            try:
+                t.bind((ip, u.getsockname()[1]))
+            except OSError:
+                continue
+            return u.getsockname()[1]
+
+def load_zone(text, path):
+    path.write_text("\n".join(line.strip() for line in text.splitlines()))
+    return stub_dns.load_zone(path)
+
+def start_stub(text, ip, port, tmp_path, delay=0):
+    """Serve zone `text` on ip:port over UDP and TCP from daemon threads."""
+    zone = load_zone(text, tmp_path / f"{ip}-{port}.zone")
+    threading.Thread(target=stub_dns.serve_tcp, args=(zone, ip, port, delay), daemon=True).start()
+    threading.Thread(target=stub_dns.serve_udp, args=(zone, ip, port, delay), daemon=True).start()
+    return zone
+
+@pytest.fixture(scope="session")
+def hierarchy(tmp_path_factory):
+    """Port the stub hierarchy listens on (the same on every address)."""
+    tmp, port = tmp_path_factory.mktemp("stubs"), free_port()
+    for ip, text in ZONES.items():
+        start_stub(text, ip, port, tmp)
+    start_stub(ZONES[ROOT], ROOT2, port, tmp)
+    return port
+
+@pytest.fixture
+def config(hierarchy, tmp_path):
+    """Iterative config against the stubs, logging into the test's directory."""
+    return Config(root_servers=[ROOT], dns_port=hierarchy, query_timeout=1, max_time=5,
+                  pipeline=["cache", "resolve", "reply"], server_ip="127.0.0.1",
+                  summary_file=str(tmp_path / "summary.csv"), step_file=str(tmp_path / "steps.csv"),
+                  metrics_file=str(tmp_path / "metrics.csv"))
+
+def start_resolver(config):
+    """Run the resolver server on a free loopback port; returns its Engine."""
+    config.server_port = free_port(config.server_ip)
+    engine = Engine(config)
+    threading.Thread(target=start_server, args=(engine,), daemon=True).start()
+    for _ in range(50):
+        try:
+            socket.create_connection((config.server_ip, config.server_port), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    return engine
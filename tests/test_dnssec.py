@@ -0,0 +1,213 @@
+"""
+DNSSEC validator: known-answer signature tests, and chains of trust built
+from stub_dns.py zones signed at test time (ECDSA keys, which are fast to
+make). The fake task answers like a set of authoritative servers.
+"""
+
+import base64, calendar, struct, time
+
+import pytest
+
+import stub_dns
+from resolver.cache import Cache
+from resolver.config import Config
+from resolver.dnssec import (SECURE, INSECURE, BOGUS, ALG_ECDSAP256, Validator, key_tag, make_ds,
+                             signed_data, verify_signature, nsec3_hash, nsec3_denial, is_below)
+from resolver.wire import T_A, T_NS, T_SOA, T_MX, T_AAAA, T_DS, T_RRSIG, T_DNSKEY, encode_domain
+
+def timestamp(text):
+    return calendar.timegm(time.strptime(text, "%Y%m%d%H%M%S"))
+
+def rrsig(covered, alg, labels, ttl, expires, incept, tag, signer, signature):
+    return (struct.pack("!HBBIIIH", covered, alg, labels, ttl, timestamp(expires), timestamp(incept), tag)
+            + encode_domain(signer) + signature)
+
+# ---------------- Known answers ----------------
+def test_ecdsa_rfc6605_example():
+    """RFC 6605 §6.1: www.example.net A signed with an ECDSA P-256 key."""
+    dnskey = struct.pack("!HBB", 257, 3, 13) + base64.b64decode(
+        "GojIhhXUN/u4v54ZQqGSnyhWJwaubCvTmeexv7bR6edbkrSqQpF64cYbcB7wNcP+e+MAnLr+Wi9xMWyQLc8NAA==")
+    signature = base64.b64decode(
+        "qx6wLYqmh+l9oCKTN6qIc+bw6ya+KJ8oMz0YP107epXAyGmt+3SNruPFKG7tZoLBLlUzGGus7ZwmwWep666VCw==")
+    head = rrsig(T_A, 13, 3, 3600, "20100909100439", "20100812100439", 55648, "example.net", b"")
+    data = signed_data(head, [("www.example.net", T_A, "192.0.2.1")])
+    assert key_tag(dnskey) == 55648
+    assert verify_signature(13, dnskey[4:], data, signature)
+    assert not verify_signature(13, dnskey[4:], data[:-1] + b"\x02", signature)
+
+def test_rsa_openssl_signature():
+    """RSA/SHA-256 signature made by `openssl dgst -sha256 -sign` over the same RRset."""
+    key = bytes.fromhex(
+        "03010001e14d225111986be04e94d9a90dee72d2c1e7513986ec28c378da2758d9479df628709dcd45a9f7a035641735"
+        "b2b3eb387cf52a258e99126616bc099155ea5d78d884635ebded8d4df0e32e1538348a0bfe4829cc6ea151c8bcaaaedc"
+        "ffc932f7603b3b5494e4acd71df280403dfff3dc0fccbf35ed95cd29eff52ef1662c6d5b")
+    signature = bytes.fromhex(
+        "3a2b7d023324ad11537f96f3cc65f059e9eb94df6b3a84b94509572216c9fa5315c6cba1b0ceb7c697c4964e908105f8"
+        "cd5918d041742412dea2afdfe76c158b5b83a1fe7b14a57df63062341f91b675f3529bacde44a9b28527fb633574cbd7"
+        "a81c31e68c5fa8e5c59e4fceba3c8a148ededd4b37f8de04768315ed547036b6")
+    head = rrsig(T_A, 8, 3, 3600, "20300101000000", "20200101000000", 11749, "example.net", b"")
+    data = signed_data(head, [("www.example.net", T_A, "192.0.2.1")])
+    assert key_tag(struct.pack("!HBB", 257, 3, 8) + key) == 11749
+    assert verify_signature(8, key, data, signature)
+    assert not verify_signature(8, key, signed_data(head, [("www.example.net", T_A, "192.0.2.2")]), signature)
+
+def test_nsec3_hash_rfc5155_examples():
+    salt = bytes.fromhex("aabbccdd")
+    assert nsec3_hash("example", salt, 12) == "0p9mhaveqvm6t7vbl5lop2u3t2rp3tom"
+    assert nsec3_hash("a.example", salt, 12) == "35mthgpgcu1qg68fab165klnsnk3dpvl"
+    assert nsec3_hash("ns1.example", salt, 12) == "2t7b4g4vsa5smi47k61mv5bv1a22bojr"
+
+# ---------------- Chain of trust ----------------
+ZONES = {
+    "": """.                 300 SOA a.root.test. admin.test. 1 7200 900 1209600 300
+           com.              300 NS  a.gtld.test.
+           a.gtld.test.      300 A   127.0.0.11""",
+    "com": """com.              300 SOA a.gtld.test. admin.test. 1 7200 900 1209600 300
+              example.com.      300 NS  ns.example.com.
+              ns.example.com.   300 A   127.0.0.12
+              unsigned.com.     300 NS  ns.unsigned.com.
+              ns.unsigned.com.  300 A   127.0.0.13""",
+    "example.com": """example.com.      300 SOA ns.example.com. admin.example.com. 1 7200 900 1209600 300
+                      www.example.com.  300 A   93.184.216.34
+                      mail.example.com. 300 MX  10 www.example.com.
+                      a.b.example.com.  300 A   93.184.216.35""",
+    "unsigned.com": """unsigned.com.     300 SOA ns.unsigned.com. admin.unsigned.com. 1 7200 900 1209600 300
+                       www.unsigned.com. 300 A   10.9.9.9""",
+}
+
+@pytest.fixture(scope="module")
+def zones(tmp_path_factory):
+    """{apex: zone data}, signed from the leaves up (unsigned.com stays unsigned)."""
+    tmp = tmp_path_factory.mktemp("zones")
+    keydir, signed = tmp / "keys", {}
+    keydir.mkdir()
+    for apex in ("unsigned.com", "example.com", "com", ""):
+        path = tmp / f"{apex or 'root'}.zone"
+        path.write_text("\n".join(line.strip() for line in ZONES[apex].splitlines()))
+        signed[apex] = stub_dns.load_zone(path)
+        if apex != "unsigned.com":
+            stub_dns.sign_zone(signed[apex], str(keydir), ALG_ECDSAP256)
+    return signed
+
+@pytest.fixture(scope="module")
+def anchor(zones):
+    dnskey = next(v for t, _, v in zones[""][""] if t == T_DNSKEY)
+    ds = make_ds("", dnskey)
+    return f". {key_tag(dnskey)} {ds[2]} {ds[3]} {ds[4:].hex()}"
+
+def zone_of(zones, name, qtype=T_A):
+    """Apex of the zone that answers for `name` (the parent, for a DS)."""
+    return max((a for a in zones if is_below(name, a) or (name == a and qtype != T_DS)), key=len)
+
+class Task:
+    """Stands in for a ResolutionTask: fetch() asks the zone that is
+    authoritative for the name (the parent, for a DS)."""
+
+    def __init__(self, zones, qtype=T_A, zone=""):
+        self.zones, self.qtype, self.zone = zones, qtype, zone
+        self.tamper = lambda ans, auth: (ans, auth)
+
+    def ask(self, name, rtype):
+        apex = zone_of(self.zones, name, rtype)
+        _, rcode, ans, auth, _ = stub_dns.answer(self.zones[apex], name, rtype)
+        ans, auth = ([r[:2] + r[3:] for r in stub_dns.with_sigs(self.zones[apex], rrs)] for rrs in (ans, auth))
+        return (rcode,) + self.tamper(ans, auth)
+
+    def denial(self, name, rtype):
+        rcode, ans, auth = self.ask(name, rtype)
+        soa = next(r[0] for r in auth if r[1] == T_SOA)
+        return ans, auth, (auth, name, rcode == 3, soa)
+
+    def fetch(self, name, rtype):
+        _, ans, auth = self.ask(name, rtype)
+        records = [r for r in ans if r[0] == name and r[1] == rtype]
+        sigs = [r for r in ans if r[1] == T_RRSIG and struct.unpack_from("!H", r[2])[0] == rtype]
+        return records, sigs, None if records else self.denial(name, rtype)[2]
+
+def validator(anchor):
+    config = Config(dnssec=True, trust_anchors=[anchor], validator_workers=0)
+    return Validator(config, Cache(300))
+
+def check(zones, anchor, name, qtype, tamper=None):
+    """Status of the stub's reply to (name, qtype), as the resolver would validate it."""
+    task = Task(zones, qtype, zone_of(zones, name))
+    if tamper:
+        task.tamper = tamper
+    rcode, ans, auth = task.ask(name, qtype)
+    denial = None if any(r[1] == qtype for r in ans) else (auth, name, rcode == 3,
+                                                            next((r[0] for r in auth if r[1] == T_SOA), task.zone))
+    used = [r for r in ans if r[1] != T_RRSIG]
+    return validator(anchor).check(task, ans, used, denial)[0]
+
+def test_signed_answer_is_secure(zones, anchor):
+    assert check(zones, anchor, "www.example.com", T_A) == SECURE
+    assert check(zones, anchor, "mail.example.com", T_MX) == SECURE
+
+def test_unsigned_delegation_is_insecure(zones, anchor):
+    assert check(zones, anchor, "www.unsigned.com", T_A) == INSECURE
+
+def test_tampered_rrsig_is_bogus(zones, anchor):
+    def flip(ans, auth):
+        return [r[:2] + (r[2][:-1] + bytes([r[2][-1] ^ 1]),) if r[1] == T_RRSIG else r for r in ans], auth
+    assert check(zones, anchor, "www.example.com", T_A, tamper=flip) == BOGUS
+
+def test_tampered_record_is_bogus(zones, anchor):
+    def swap(ans, auth):
+        return [r[:2] + ("6.6.6.6",) if r[1] == T_A else r for r in ans], auth
+    assert check(zones, anchor, "www.example.com", T_A, tamper=swap) == BOGUS
+
+def test_wrong_anchor_is_bogus(zones, anchor):
+    wrong = anchor.split()
+    wrong[-1] = "00" * 32
+    assert check(zones, " ".join(wrong), "www.example.com", T_A) == BOGUS
+    assert check(zones, " ".join(wrong), "www.unsigned.com", T_A) == BOGUS
+
+# ---------------- Denial of existence ----------------
+def test_nxdomain_and_nodata_are_proven(zones, anchor):
+    assert check(zones, anchor, "nope.example.com", T_A) == SECURE
+    assert check(zones, anchor, "www.example.com", T_AAAA) == SECURE
+    assert check(zones, anchor, "b.example.com", T_A) == SECURE  # empty non-terminal
+
+def test_negative_answer_without_proof_is_bogus(zones, anchor):
+    def strip_nsec(ans, auth):
+        return ans, [r for r in auth if r[1] == T_SOA or (r[1] == T_RRSIG and r[2][:2] == struct.pack("!H", T_SOA))]
+    assert check(zones, anchor, "nope.example.com", T_A, tamper=strip_nsec) == BOGUS
+    assert check(zones, anchor, "www.example.com", T_AAAA, tamper=lambda ans, auth: (ans, [])) == BOGUS
+
+def test_replayed_proof_is_bogus(zones, anchor):
+    """A proof must not deny another name, nor turn a NODATA into an NXDOMAIN."""
+    task = Task(zones, T_A, "example.com")
+    _, auth, _ = task.denial("nope.example.com", T_A)
+    assert validator(anchor).check(task, [], [], (auth, "www.example.com", True, "example.com"))[0] == BOGUS
+    _, auth, _ = task.denial("b.example.com", T_A)
+    assert validator(anchor).check(task, [], [], (auth, "b.example.com", True, "example.com"))[0] == BOGUS
+
+def test_missing_ds_needs_a_proof(zones, anchor):
+    task = Task(zones, T_A, "unsigned.com")
+    assert validator(anchor).zone_keys(task, "unsigned.com")[0] == INSECURE
+    # A DS NODATA whose NSEC was dropped no longer passes for an unsigned delegation
+    task.tamper = lambda ans, auth: (ans, [r for r in auth if r[1] in (T_SOA, T_RRSIG)])
+    assert validator(anchor).zone_keys(task, "unsigned.com")[0] == BOGUS
+    # Names that are not delegations cannot be turned into unsigned zones either
+    assert validator(anchor).zone_keys(Task(zones), "www.example.com")[0] == BOGUS
+
+def nsec3_chain(names, salt=b"\xab", iterations=2, opt_out=0):
+    """(owner hash, flags, next hash, types) for `names` ({name: types})."""
+    hashed = sorted((nsec3_hash(n, salt, iterations), types) for n, types in names.items())
+    return [(h, opt_out, hashed[(i + 1) % len(hashed)][0], types) for i, (h, types) in enumerate(hashed)]
+
+def test_nsec3_proofs():
+    names = {"example.com": {T_SOA, T_NS}, "www.example.com": {T_A}, "sub.example.com": {T_NS}}
+    chain = nsec3_chain(names)
+    assert nsec3_denial("example.com", "nope.example.com", T_A, True, chain, b"\xab", 2) == SECURE
+    assert nsec3_denial("example.com", "www.example.com", T_AAAA, False, chain, b"\xab", 2) == SECURE
+    assert nsec3_denial("example.com", "www.example.com", T_A, False, chain, b"\xab", 2) == BOGUS
+    assert nsec3_denial("example.com", "www.example.com", T_A, True, chain, b"\xab", 2) == BOGUS
+    assert nsec3_denial("example.com", "sub.example.com", T_DS, False, chain, b"\xab", 2, cut=True) == SECURE
+    assert nsec3_denial("example.com", "www.example.com", T_DS, False, chain, b"\xab", 2, cut=True) == BOGUS
+    assert nsec3_denial("example.com", "x.sub.example.com", T_A, True, chain, b"\xab", 2) == BOGUS
+    assert nsec3_denial("example.com", "nope.example.com", T_A, True, chain, b"\xab", 200) == BOGUS
+    # Opt-out: an unsigned delegation left out of the chain is insecure, not proven
+    del names["sub.example.com"]
+    opt_out = nsec3_chain(names, opt_out=1)
+    assert nsec3_denial("example.com", "sub.example.com", T_DS, False, opt_out, b"\xab", 2, cut=True) == INSECURE
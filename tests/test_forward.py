@@ -0,0 +1,94 @@
+"""
+Forwarding mode against stub_dns.py upstreams on loopback: each transport,
+failover to a healthy upstream, truncated UDP answers, and pipelining on one
+TCP connection.
+"""
+
+import shutil, ssl, subprocess, threading, time
+
+import pytest
+
+import stub_dns
+from resolver.engine import Engine
+from resolver.forward import MAX_FAILS, StreamUpstream, UpstreamPool
+from resolver.wire import T_A, RCODE_OK, build_query, parse_response, parse_question
+from conftest import EXAMPLE, ZONES, free_port, load_zone, start_stub
+
+DEAD = "127.0.0.19"  # nothing listens here
+
+@pytest.fixture(scope="module")
+def tls_port(tmp_path_factory):
+    """DNS-over-TLS stub for example.com on EXAMPLE, with a certificate for stub.test."""
+    if not shutil.which("openssl"):
+        pytest.skip("openssl is needed to make a test certificate")
+    tmp, port = tmp_path_factory.mktemp("tls"), free_port(EXAMPLE)
+    cert, key = str(tmp / "cert.pem"), str(tmp / "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-keyout", key,
+                    "-out", cert, "-subj", "/CN=stub.test", "-addext", "subjectAltName=DNS:stub.test"],
+                   check=True, capture_output=True)
+    ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ctx.load_cert_chain(cert, key)
+    zone = load_zone(ZONES[EXAMPLE], tmp / "example.zone")
+    threading.Thread(target=stub_dns.serve_tcp, args=(zone, EXAMPLE, port, 0, ctx), daemon=True).start()
+    return port, cert
+
+@pytest.fixture
+def forward(config):
+    config.mode, config.cache = "forward", False
+    return config
+
+def answer(resp):
+    return [r[2] for r in parse_response(resp)[0]]
+
+def test_each_transport(forward, hierarchy, tls_port):
+    port, cert = tls_port
+    urls = [f"udp://{EXAMPLE}:{hierarchy}", f"tcp://{EXAMPLE}:{hierarchy}", f"tls://{EXAMPLE}:{port}#stub.test"]
+    pool = UpstreamPool(urls, 2, cert)
+    for url in urls:
+        query = build_query("www.example.com")
+        resp, rtt = pool.exchange(url, query)
+        assert resp[:2] == query[:2] and answer(resp) == ["93.184.216.34"], url
+    pool.close()
+
+def test_failover_marks_dead_upstream_down(forward, hierarchy):
+    live = f"udp://{EXAMPLE}:{hierarchy}"
+    forward.upstreams = [f"udp://{DEAD}:{hierarchy}", live]
+    engine = Engine(forward)
+    for _ in range(MAX_FAILS + 1):
+        q = engine.resolve("www.example.com")
+        assert q.rcode == RCODE_OK and q.result == "93.184.216.34"
+    pool = engine.upstream_pool()
+    for _ in range(MAX_FAILS):
+        pool.exchange(forward.upstreams[0], build_query("www.example.com"), 0.2)
+    assert pool.upstreams[forward.upstreams[0]]["down"]
+    assert pool.candidates()[0] == live
+
+def test_truncated_udp_answer_goes_to_next_upstream(forward, hierarchy):
+    forward.upstreams = [f"udp://{EXAMPLE}:{hierarchy}"]
+    q = Engine(forward).resolve("big.example.com")
+    assert q.failure[0] == "SERVERS_EXHAUSTED" and "TRUNCATED" in [s[4] for s in q.steps]
+    forward.upstreams.append(f"tcp://{EXAMPLE}:{hierarchy}")
+    assert len(Engine(forward).resolve("big.example.com").records) == 40
+
+def test_stream_pipelines_queries_on_one_connection(tmp_path):
+    ip, port = "127.0.0.18", free_port("127.0.0.18")
+    start_stub(ZONES[EXAMPLE], ip, port, tmp_path, delay=0.3)
+    upstream, connects = StreamUpstream(ip, port, timeout=2), []
+    connect = upstream.connect
+    upstream.connect = lambda: connects.append(1) or connect()
+
+    names = ["www.example.com", "mail.example.com", "alias.example.com", "nothing.example.com"] * 3
+    results = [None] * len(names)
+    def ask(i):
+        results[i] = upstream.exchange(build_query(names[i], T_A), 2)
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(len(names))]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # Serialized, 12 answers would take 3.6 s; pipelined they overlap
+    assert time.time() - start < 1.5
+    assert len(connects) == 1
+    assert [parse_question(r, 12)[0] for r in results] == names
+    upstream.close()
@@ -0,0 +1,72 @@
+"""
+Iterative resolution against the stub hierarchy: any qtype, CNAME chains,
+truncated answers retried over TCP, and the per-query budget.
+"""
+
+import socket, struct
+
+from resolver.engine import Engine
+from resolver.wire import (T_A, T_AAAA, T_MX, T_CNAME, RCODE_OK, RCODE_SERVFAIL, build_query, send_query,
+                           parse_response, recv_exact)
+from conftest import ROOT, ROOT2, start_resolver
+
+def resolve(config, name, qtype=T_A):
+    return Engine(config).resolve(name, qtype)
+
+def test_any_qtype_in_presentation_format(config):
+    assert resolve(config, "www.example.com", T_AAAA).result == "2001:db8::34"
+    assert resolve(config, "mail.example.com", T_MX).result == "10 www.example.com"
+    assert resolve(config, "txt.example.com", 16).result == "\\# 6 0568656c6c6f"
+    q = resolve(config, "nothing.example.com", T_AAAA)
+    assert (q.rcode, q.result) == (3, "FAIL")
+    assert resolve(config, "www.example.com", T_MX).result == "NODATA"
+
+def test_cname_chain_in_one_answer(config):
+    q = resolve(config, "alias.example.com")
+    assert q.records == [("alias.example.com", T_CNAME, "www.example.com"), ("www.example.com", T_A, "93.184.216.34")]
+
+def test_cname_chain_across_zones(config):
+    engine = Engine(config)
+    q = engine.resolve("OUT.example.com")
+    assert q.rcode == RCODE_OK and q.result == "198.51.100.7"
+    assert q.records[0] == ("out.example.com", T_CNAME, "www.other.com")
+    again = engine.resolve("out.example.com")
+    assert again.cache_hit and again.records == q.records
+
+def test_cname_loop_fails(config):
+    q = resolve(config, "loop1.example.com")
+    assert q.rcode == RCODE_SERVFAIL and q.failure[0] == "CNAME_LOOP"
+
+def test_truncated_answer_retried_over_tcp(config):
+    q = resolve(config, "big.example.com")
+    assert len(q.records) == 40
+    assert [s[4] for s in q.steps][-2:] == ["TRUNCATED", "ANSWER"]
+
+def test_server_sets_tc_and_answers_over_tcp(config):
+    config.pipeline.append("log")
+    start_resolver(config)
+    query = build_query("big.example.com")
+    resp, _ = send_query("127.0.0.1", query, 5, config.server_port)
+    assert resp[2] & 0x02 and 0 < len(parse_response(resp)[0]) < 40
+
+    with socket.create_connection(("127.0.0.1", config.server_port), timeout=5) as s:
+        s.sendall(struct.pack("!H", len(query)) + query)
+        resp = recv_exact(s, struct.unpack("!H", recv_exact(s, 2))[0])
+    assert not resp[2] & 0x02 and len(parse_response(resp)[0]) == 40
+
+# ---------------- Budget ----------------
+def test_query_budget(config):
+    config.max_queries = 2
+    q = resolve(config, "www.example.com")
+    assert q.rcode == RCODE_SERVFAIL and q.failure == ("QUERY_BUDGET", "www.example.com")
+
+def test_time_budget(config):
+    config.max_time = 0
+    assert resolve(config, "www.example.com").failure[0] == "TIME_BUDGET"
+
+def test_unresolvable_ns_stops_at_the_referral(config):
+    config.root_servers = [ROOT, ROOT2]
+    q = resolve(config, "www.lame.com")
+    assert q.failure == ("NO_NS_ADDRESS", "ns.nowhere.com=NXDOMAIN")
+    # The other root would only repeat the referral to com
+    assert ROOT2 not in {s[2] for s in q.steps}
@@ -0,0 +1,37 @@
+"""
+Admission control: token buckets, their eviction order, and the refusal
+counters reaching the metrics file while everything is being refused.
+"""
+
+import csv, time
+from collections import OrderedDict
+
+from resolver.server import admit
+from resolver.wire import RCODE_SERVFAIL, build_query, send_query, response_status
+from conftest import start_resolver
+
+def test_bucket_allows_burst_then_refills():
+    buckets = OrderedDict()
+    assert [admit(buckets, "c", 0, 2, 10) for _ in range(3)] == [True, True, False]
+    tokens, ts = buckets["c"]
+    buckets["c"] = (tokens, ts - 1)  # one second later at rate 1
+    assert admit(buckets, "c", 1, 2, 10)
+    assert not admit(buckets, "c", 1, 2, 10)
+
+def test_full_table_drops_least_recently_seen():
+    buckets = OrderedDict()
+    for key in ("a", "b", "a", "c"):
+        admit(buckets, key, 1, 1, 2)
+    assert list(buckets) == ["a", "c"]
+
+def test_refusals_reach_the_metrics_file(config):
+    config.client_rate, config.client_burst = 0, 1
+    config.pipeline.append("log")
+    start_resolver(config)
+    rcodes = [response_status(send_query("127.0.0.1", build_query("www.example.com"), 5, config.server_port)[0])[0]
+              for _ in range(4)]
+    assert rcodes == [0] + [RCODE_SERVFAIL] * 3
+    time.sleep(1.5)  # the flusher runs once a second
+    with open(config.metrics_file) as f:
+        metrics = next(csv.DictReader(f))
+    assert (metrics["Total Queries"], metrics["Rate Limited"]) == ("1", "3")